@@ -0,0 +1,58 @@
+"""
+Measure the book insert throughput of the batch path against one book per commit.
+
+    python -m benchmarks.batch_insert --books 5000
+
+It writes to the database of DATABASE_URL and the books are left there, run
+it against a development database.
+"""
+import argparse
+import asyncio
+import time
+
+from src.books.schemas import BookCreateModel
+from src.books.service import BookService
+from src.db.main import async_session_maker, db_connect
+
+book_service = BookService()
+
+def make_books(count: int) -> list[dict]:
+    return [
+        {
+            "title": f"Benchmark book {i}",
+            "author": "Some Author",
+            "publisher": "Some Publisher",
+            "published_date": "2020-01-01",
+            "page_count": 300,
+            "language": "English"
+        }
+        for i in range(count)
+    ]
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--single", type=int, default=500, help="books created one per commit")
+    args = parser.parse_args()
+
+    async with async_session_maker() as session:
+        started_at = time.perf_counter()
+        result = await book_service.create_books(make_books(args.books), user_uid=None, session=session)
+        elapsed = time.perf_counter() - started_at
+
+    print(f"create_books        {len(result['created']):>7} rows {len(result['created']) / elapsed:>10.0f} rows/s")
+
+    async with async_session_maker() as session:
+        started_at = time.perf_counter()
+
+        for book in make_books(args.single):
+            await book_service.create_book(BookCreateModel(**book), user_uid=None, session=session)
+
+        elapsed = time.perf_counter() - started_at
+
+    print(f"create_book x {args.single:<5} {args.single:>7} rows {args.single / elapsed:>10.0f} rows/s")
+
+    await db_connect.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""
+Compare the ways the bodies of a bulk send can be rendered.
+
+    python -m benchmarks.mail_templates --recipients 10000
+
+The templates of src/templates are rendered in memory, nothing is sent. Along
+with the time, the longest stall of the event loop during the render is shown:
+a render on the loop stalls every other request of the worker for its duration.
+"""
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from src.mail_templates import mail_templates
+
+def books(count: int) -> list[dict]:
+    return [{"title": f"Book {i}", "author": f"Author {i}"} for i in range(count)]
+
+def contexts(recipients: int, shared: bool) -> list[dict]:
+    catalog = books(10)
+
+    if shared:
+        return [{"subject": "New books", "name": "reader", "books": catalog}] * recipients
+
+    return [{"subject": "New books", "name": f"reader {i}", "books": catalog} for i in range(recipients)]
+
+def render_uncompiled(context_list: list[dict]) -> list[str]:
+    # what loading the template per message does: read, parse and compile every time
+    bodies = []
+
+    for context in context_list:
+        environment = Environment(
+            loader=FileSystemLoader(Path(mail_templates.folder)),
+            autoescape=select_autoescape(["html", "xml"])
+        )
+        template = environment.get_template("newsletter.html")
+        bodies.append(template.render(**context, locale="en", domain="localhost"))
+
+    return bodies
+
+async def measure(name: str, render) -> list[str]:
+    longest_stall = 0.0
+    running = True
+
+    async def watch_loop():
+        nonlocal longest_stall
+
+        while running:
+            started_at = time.perf_counter()
+            await asyncio.sleep(0.001)
+            longest_stall = max(longest_stall, time.perf_counter() - started_at - 0.001)
+
+    watcher = asyncio.create_task(watch_loop())
+    await asyncio.sleep(0.01)
+    started_at = time.perf_counter()
+    bodies = await render()
+    elapsed = time.perf_counter() - started_at
+    running = False
+    await watcher
+
+    print(f"{name:<44} {elapsed * 1000:9.1f} ms   loop stalled up to {longest_stall * 1000:7.1f} ms")
+
+    return bodies
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=10000)
+    args = parser.parse_args()
+
+    mail_templates.load()
+    personal = contexts(args.recipients, shared=False)
+    shared = contexts(args.recipients, shared=True)
+
+    async def on_loop(render):
+        return render()
+
+    reference = await measure(
+        "compile per message, on the loop",
+        lambda: on_loop(lambda: render_uncompiled(personal))
+    )
+    precompiled = await measure(
+        "precompiled, on the loop",
+        lambda: on_loop(lambda: [mail_templates.render("newsletter.html", context) for context in personal])
+    )
+    mail_templates.cache.clear()
+    batch = await measure(
+        "precompiled, render_batch in the pool",
+        lambda: mail_templates.render_batch("newsletter.html", personal, cache=False)
+    )
+    cached = await measure(
+        "same body for all, render cache",
+        lambda: on_loop(lambda: [mail_templates.render("newsletter.html", context) for context in shared])
+    )
+
+    assert reference == precompiled == batch, "the renders differ"
+    assert len(set(cached)) == 1
+
+    mail_templates.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+"""
+Measure the latency of the book search.
+
+    python -m benchmarks.search --seed 1000000
+    python -m benchmarks.search --cleanup
+
+--seed adds synthetic books (publisher "Benchmark Press") to the database of
+DATABASE_URL with one INSERT ... SELECT, --cleanup removes them again. Every
+query is run --repeat times through BookService.search_books and the plan of
+the first one is printed to check the GIN index is used.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import text
+
+from src.books.service import BookService
+from src.db.main import async_session_maker, db_connect
+
+book_service = BookService()
+
+BENCHMARK_PUBLISHER = "Benchmark Press"
+# two syllable made up words, 1600 of them so a word is in about 0.2% of the titles
+SYLLABLES = [
+    "ka", "lo", "mi", "ra", "ven", "tor", "sil", "mar", "dun", "bel", "cor", "fen", "gal", "hal",
+    "jor", "kel", "lun", "mor", "nor", "pel", "quin", "ros", "sar", "tal", "ul", "vor", "wen",
+    "xan", "yor", "zel", "ar", "el", "is", "on", "ur", "ith", "ash", "ek", "ov", "ax",
+]
+WORDS = [first + second for first in SYLLABLES for second in SYLLABLES]
+QUERIES = ["kalo", "kalo mira", "\"kalo mira\"", "kalo -mira", "kalo OR mira", "torka"]
+
+SEED_SQL = """
+    INSERT INTO books (uid, title, author, publisher, published_date, page_count, language, created_at, updated_at)
+    SELECT
+        gen_random_uuid(),
+        initcap(
+            w[1 + abs(hashtext(i || 'a')) % n] || ' ' ||
+            w[1 + abs(hashtext(i || 'b')) % n] || ' ' ||
+            w[1 + abs(hashtext(i || 'c')) % n]
+        ),
+        initcap(w[1 + abs(hashtext(i || 'd')) % n] || ' ' || w[1 + abs(hashtext(i || 'e')) % n]),
+        :publisher,
+        (1900 + i % 120)::text,
+        100 + i % 600,
+        (ARRAY['English', 'French', 'German'])[1 + i % 3],
+        now() - make_interval(secs => i),
+        now()
+    FROM generate_series(1, :count) AS i,
+        (SELECT CAST(:words AS text[]) AS w, cardinality(CAST(:words AS text[])) AS n) AS vocabulary
+"""
+
+async def seed(count: int) -> None:
+    started_at = time.perf_counter()
+
+    async with db_connect.begin() as conn:
+        await conn.execute(text(SEED_SQL), {"count": count, "publisher": BENCHMARK_PUBLISHER, "words": WORDS})
+        await conn.execute(text("ANALYZE books"))
+
+    print(f"seeded {count} books in {time.perf_counter() - started_at:.1f} s")
+
+async def cleanup() -> None:
+    async with db_connect.begin() as conn:
+        result = await conn.execute(
+            text("DELETE FROM books WHERE publisher = :publisher"), {"publisher": BENCHMARK_PUBLISHER}
+        )
+
+    print(f"removed {result.rowcount} books")
+
+async def explain(query: str) -> None:
+    async with db_connect.connect() as conn:
+        result = await conn.execute(
+            text(
+                "EXPLAIN ANALYZE SELECT uid, ts_rank_cd(search_vector, q) AS rank "
+                "FROM books, websearch_to_tsquery('english', :query) AS q "
+                "WHERE search_vector @@ q ORDER BY rank DESC, uid DESC LIMIT 21"
+            ),
+            {"query": query}
+        )
+
+        print("\n".join(row[0] for row in result))
+
+async def run(queries: list[str], repeat: int, limit: int, language: str | None) -> None:
+    async with db_connect.connect() as conn:
+        total = (await conn.execute(text("SELECT count(*) FROM books"))).scalar()
+
+    print(f"{total} books in the catalog\n")
+    await explain(queries[0])
+    print()
+
+    async with async_session_maker() as session:
+        for query in queries:
+            timings = []
+
+            for _ in range(repeat):
+                started_at = time.perf_counter()
+                page = await book_service.search_books(query, session, limit=limit, language=language)
+                timings.append((time.perf_counter() - started_at) * 1000)
+
+            timings.sort()
+            p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+            matches = (await session.exec(
+                text("SELECT count(*) FROM books WHERE search_vector @@ websearch_to_tsquery('english', :query)"),
+                params={"query": query}
+            )).scalar()
+            print(
+                f"{query:<24} {matches:>7} matches  "
+                f"p50 {statistics.median(timings):7.2f} ms  p95 {p95:7.2f} ms  max {timings[-1]:7.2f} ms"
+            )
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=0, help="synthetic books to add first")
+    parser.add_argument("--cleanup", action="store_true", help="remove the synthetic books and exit")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--language", default=None)
+    parser.add_argument("queries", nargs="*", default=QUERIES)
+    args = parser.parse_args()
+
+    if args.cleanup:
+        await cleanup()
+    else:
+        if args.seed:
+            await seed(args.seed)
+
+        await run(args.queries, args.repeat, args.limit, args.language)
+
+    await db_connect.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
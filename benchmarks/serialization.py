@@ -0,0 +1,77 @@
+"""
+Compare the ways a page of books can be turned into a response body.
+
+    python -m benchmarks.serialization --books 1000 --tags 3
+
+The books are built in memory, no database is needed.
+"""
+import argparse
+import timeit
+import uuid
+from datetime import datetime
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from src.books.schemas import BookPageSchema
+from src.books.serializers import book_page_to_dict
+from src.db.models import Book, Tag
+from src.responses import dumps
+
+def make_books(count: int, tags: int) -> list[Book]:
+    now = datetime.now()
+    shared_tags = [Tag(uid=uuid.uuid4(), name=f"tag {i}", created_at=now, updated_at=now) for i in range(tags)]
+    books = []
+
+    for i in range(count):
+        book = Book(
+            uid=uuid.uuid4(),
+            title=f"Book {i}",
+            author="Some Author",
+            publisher="Some Publisher",
+            published_date="2020-01-01",
+            page_count=300,
+            language="English",
+            user_uid=uuid.uuid4(),
+            created_at=now,
+            updated_at=now,
+            review_count=5,
+            rating_sum=20,
+            avg_rating=4.0
+        )
+        book.tags = list(shared_tags)
+        books.append(book)
+
+    return books
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--tags", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    books = make_books(args.books, args.tags)
+    page = {"items": books, "next_cursor": None}
+
+    candidates = {
+        # what FastAPI does for a response_model route returning the ORM objects
+        "response_model + jsonable_encoder": lambda: JSONResponse(
+            jsonable_encoder(BookPageSchema.model_validate(page, from_attributes=True))
+        ).body,
+        "pydantic model_dump_json": lambda: BookPageSchema.model_validate(
+            page, from_attributes=True
+        ).model_dump_json().encode(),
+        "dict + orjson": lambda: dumps(book_page_to_dict(books, None)),
+    }
+
+    reference = orjson.loads(candidates["pydantic model_dump_json"]())
+
+    for name, candidate in candidates.items():
+        assert orjson.loads(candidate()) == reference, f"{name} produces a different document"
+        best = min(timeit.repeat(candidate, number=1, repeat=args.repeat))
+        print(f"{name:<36} {best * 1000:9.2f} ms")
+
+if __name__ == "__main__":
+    main()
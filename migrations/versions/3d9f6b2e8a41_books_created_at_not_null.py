@@ -0,0 +1,42 @@
+"""books created_at not null
+
+Revision ID: 3d9f6b2e8a41
+Revises: c58e2f9a4d13
+Create Date: 2026-10-18 23:05:27.184630
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# TODO: add new this
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9f6b2e8a41'
+down_revision: Union[str, None] = 'c58e2f9a4d13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the keyset pagination of the listings needs a created_at on every book
+    op.execute("UPDATE books SET created_at = coalesce(updated_at, now()) WHERE created_at IS NULL")
+    # SET NOT NULL alone scans the table under an ACCESS EXCLUSIVE lock. A validated
+    # check constraint lets postgres skip that scan, and VALIDATE only takes a lock
+    # that lets writes through, so every step runs in its own transaction.
+    with op.get_context().autocommit_block():
+        op.execute(
+            "ALTER TABLE books ADD CONSTRAINT ck_books_created_at_not_null "
+            "CHECK (created_at IS NOT NULL) NOT VALID"
+        )
+        op.execute("ALTER TABLE books VALIDATE CONSTRAINT ck_books_created_at_not_null")
+        op.alter_column('books', 'created_at', existing_type=sa.TIMESTAMP(), nullable=False)
+        op.drop_constraint('ck_books_created_at_not_null', 'books', type_='check')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('books', 'created_at', existing_type=sa.TIMESTAMP(), nullable=True)
@@ -0,0 +1,38 @@
+"""add books created_at uid index
+
+Revision ID: 5a1e3c7d9b20
+Revises: 33f028ca59b4
+Create Date: 2026-10-18 10:12:41.503318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# TODO: add new this
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = '5a1e3c7d9b20'
+down_revision: Union[str, None] = '33f028ca59b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY does not block writes to books while it builds
+    # but cannot run in a transaction. A failed build leaves an invalid index
+    # behind, drop it and run the upgrade again.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_books_created_at_uid', 'books', ['created_at', 'uid'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_books_created_at_uid', table_name='books', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,40 @@
+"""reviews created_at not null
+
+Revision ID: 8c1e4a7f2b59
+Revises: 3d9f6b2e8a41
+Create Date: 2026-10-18 23:18:52.406137
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# TODO: add new this
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1e4a7f2b59'
+down_revision: Union[str, None] = '3d9f6b2e8a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the keyset pagination of the review pages needs a created_at on every review
+    op.execute("UPDATE reviews SET created_at = coalesce(updated_at, now()) WHERE created_at IS NULL")
+    # through a validated check constraint like 3d9f6b2e8a41, reviews stay writable meanwhile
+    with op.get_context().autocommit_block():
+        op.execute(
+            "ALTER TABLE reviews ADD CONSTRAINT ck_reviews_created_at_not_null "
+            "CHECK (created_at IS NOT NULL) NOT VALID"
+        )
+        op.execute("ALTER TABLE reviews VALIDATE CONSTRAINT ck_reviews_created_at_not_null")
+        op.alter_column('reviews', 'created_at', existing_type=sa.TIMESTAMP(), nullable=False)
+        op.drop_constraint('ck_reviews_created_at_not_null', 'reviews', type_='check')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('reviews', 'created_at', existing_type=sa.TIMESTAMP(), nullable=True)
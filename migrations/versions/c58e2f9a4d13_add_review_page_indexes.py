@@ -0,0 +1,48 @@
+"""add review page indexes
+
+Revision ID: c58e2f9a4d13
+Revises: a93d5e1f7c24
+Create Date: 2026-10-18 21:36:04.518267
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# TODO: add new this
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = 'c58e2f9a4d13'
+down_revision: Union[str, None] = 'a93d5e1f7c24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_reviews_book_uid_created_at_uid', 'reviews', ['book_uid', 'created_at', 'uid']),
+    ('ix_reviews_book_uid_rating_created_at_uid', 'reviews', ['book_uid', 'rating', 'created_at', 'uid']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # built concurrently like f41c8b2d7e06, ix_reviews_book_uid is dropped once
+    # the composite index starting with book_uid exists
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True
+            )
+        op.drop_index('ix_reviews_book_uid', table_name='reviews', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_reviews_book_uid', 'reviews', ['book_uid'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True
+        )
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,48 @@
+"""add lookup indexes concurrently
+
+Revision ID: f41c8b2d7e06
+Revises: e2a94c7d6b31
+Create Date: 2026-10-18 18:47:12.660394
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# TODO: add new this
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = 'f41c8b2d7e06'
+down_revision: Union[str, None] = 'e2a94c7d6b31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# tags.name (uq_tags_name), book_tags.tag_id and books.created_at
+# (ix_books_created_at_uid) are indexed by earlier revisions.
+INDEXES = [
+    ('ix_user_accounts_email', 'user_accounts', ['email']),
+    ('ix_books_user_uid_created_at_uid', 'books', ['user_uid', 'created_at', 'uid']),
+    ('ix_reviews_book_uid', 'reviews', ['book_uid']),
+    ('ix_reviews_user_uid', 'reviews', ['user_uid']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY does not block writes but cannot run in a
+    # transaction. A failed build leaves an invalid index behind, drop it and
+    # run the upgrade again.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
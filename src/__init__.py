@@ -5,8 +5,15 @@ from src.auth.routes import auth_router
 from src.reviews.routes import review_router
 from src.tags.routes import tag_router
 from src.errors import register_error_handlers
-from src.db.main import initdb
+from src.db.main import db_connect, get_pool_stats
+from src.db.redis import backend, revocation_filter
+from src.auth.utils import password_hash_executor
+from src.access_log import access_logger
+from src.mail_dispatch import mail_dispatcher
+from src.mail_templates import mail_templates
 from src.middleware import register_middleware
+from src.responses import FastJSONResponse
+from src.metrics import register_metrics
 
 from contextlib import asynccontextmanager
 
@@ -17,16 +24,31 @@ version = "v1"
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Server is Starting")
-    await initdb()
+    # the schema is managed by the alembic migrations
+    if revocation_filter is not None:
+        await revocation_filter.start()
+    # compiled once, a template error fails the startup instead of a send
+    mail_templates.load()
+    await mail_dispatcher.start()
     yield
     print("Server is Stopping")
+    await mail_dispatcher.stop()
+    if revocation_filter is not None:
+        await revocation_filter.stop()
+    await backend.close()
+    await db_connect.dispose()
+    password_hash_executor.shutdown(wait=False)
+    mail_templates.close()
+    access_logger.stop()
 
 # Instantiate the FastAPI application here
 app = FastAPI(
     title="Book API",
     description="A Backend API for book web app",
     version=version,
-    # lifespan=lifespan
+    lifespan=lifespan,
+    # orjson renders the responses instead of the standard library json
+    default_response_class=FastJSONResponse
 )
 
 # register error handler here
@@ -35,6 +57,9 @@ register_error_handlers(app)
 # register middleware here
 register_middleware(app)
 
+# register the prometheus metrics endpoint here
+register_metrics(app)
+
 # Include the books_router here
 app.include_router(
     book_router,
@@ -58,4 +83,9 @@ app.include_router(
     tag_router,
     prefix=f"/api/{version}/tags",
     tags=["tags"]
-)
\ No newline at end of file
+)
+
+# connection pool saturation of this worker for monitoring
+@app.get(f"/api/{version}/health/db", include_in_schema=False)
+async def db_pool_stats():
+    return get_pool_stats()
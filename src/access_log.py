@@ -0,0 +1,85 @@
+import json
+import logging
+import queue
+import sys
+import threading
+
+from src.config import Config
+
+_STOP = object()
+
+class AccessLogWriter:
+    """
+    Structured access log written by a background thread.
+
+    Requests only put a dict on a bounded queue, the writer thread encodes the
+    records as json lines and writes them in batches to a file or stdout. When
+    the queue is full the record is dropped and counted instead of blocking the
+    request.
+    """
+    def __init__(self, path: str | None, queue_size: int, batch_size: int) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def log(self, record: dict) -> None:
+        if self._thread is None:
+            self.start()
+
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="access_log", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Flush the queued records and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        stream = open(self.path, "a", encoding="utf-8") if self.path else sys.stdout
+
+        try:
+            while True:
+                batch = [self._queue.get()]
+
+                # take whatever else is already queued, up to one batch
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                stopping = any(record is _STOP for record in batch)
+                records = [record for record in batch if record is not _STOP]
+
+                try:
+                    stream.write("".join(json.dumps(record, default=str) + "\n" for record in records))
+                    stream.flush()
+                except Exception as e:
+                    logging.exception(e)
+
+                if stopping:
+                    return
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+access_logger = AccessLogWriter(
+    path=Config.ACCESS_LOG_FILE,
+    queue_size=Config.ACCESS_LOG_QUEUE_SIZE,
+    batch_size=Config.ACCESS_LOG_BATCH_SIZE
+)
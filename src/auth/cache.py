@@ -0,0 +1,81 @@
+import logging
+from typing import Optional
+
+from src.cache import TTLCache
+from src.config import Config
+from src.db.redis import get_cached_value, set_cached_value, delete_cached_value
+from src.metrics import CACHE_LOOKUPS
+
+from .schemas import Principal
+
+class UserIdentityCache:
+    """
+    Two tier cache of the lean identity (uid, email, role) of users by email.
+    
+    The in-process tier answers most lookups, the optional redis tier is shared
+    by all workers. Only identities that exist are cached, the password hash and
+    the relationships of the user are never stored.
+    """
+    key_prefix = "user_identity:"
+    
+    def __init__(self, maxsize: int, ttl: int, use_redis: bool, redis_ttl: int) -> None:
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl, name="user_identity")
+        self.use_redis = use_redis
+        self.redis_ttl = redis_ttl
+        self.redis_hits = CACHE_LOOKUPS.labels("user_identity_redis", "hit")
+        self.redis_misses = CACHE_LOOKUPS.labels("user_identity_redis", "miss")
+        
+    async def get(self, email: str) -> Optional[Principal]:
+        identity = self.local.get(email)
+        
+        if identity is not None or not self.use_redis:
+            return identity
+            
+        try:
+            cached = await get_cached_value(self.key_prefix + email)
+        except Exception as e:
+            # the database is still the source of truth when redis is down
+            logging.exception(e)
+            return None
+            
+        if cached is None:
+            self.redis_misses.inc()
+            return None
+            
+        self.redis_hits.inc()
+        identity = Principal.model_validate_json(cached)
+        self.local.set(email, identity)
+        
+        return identity
+    
+    async def set(self, identity: Principal) -> None:
+        self.local.set(identity.email, identity)
+        
+        if self.use_redis:
+            try:
+                await set_cached_value(
+                    self.key_prefix + identity.email, identity.model_dump_json(), ex=self.redis_ttl
+                )
+            except Exception as e:
+                logging.exception(e)
+                
+    async def invalidate(self, email: str) -> None:
+        """
+        Drop the identity after a write, other workers drop their local copy when it expires
+        """
+        self.local.delete(email)
+        
+        if self.use_redis:
+            try:
+                await delete_cached_value(self.key_prefix + email)
+            except Exception as e:
+                # the write is already committed, the redis copy expires after redis_ttl
+                logging.exception(e)
+                
+
+user_identity_cache = UserIdentityCache(
+    maxsize=Config.USER_CACHE_SIZE,
+    ttl=Config.USER_CACHE_TTL,
+    use_redis=Config.USER_CACHE_REDIS,
+    redis_ttl=Config.USER_CACHE_REDIS_TTL
+)
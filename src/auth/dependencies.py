@@ -6,13 +6,14 @@ from .utils import decode_token
 from src.db.redis import token_in_blocklist
 from src.db.main import get_session
 from .service import UserService
-from .schemas import UserModel
+from .schemas import Principal
 
 from src.errors import (
     InvalidTokenException,
     RefreshTokenRequiredException,
     AccessTokenRequiredException,
-    InsufficientPermissionException
+    InsufficientPermissionException,
+    UserNotFoundException
 )
 
 from typing import List, Any
@@ -24,18 +25,24 @@ class TokenBearer(HTTPBearer):
         super().__init__(auto_error=auto_error)
         
     async def __call__(self, request: Request) -> HTTPAuthorizationCredentials | None:
-        creds = await super().__call__(request)
-        # get the token in auth header automatically
-        token = creds.credentials
-
-        token_data = self.token_valid(token)
-        
+        # every bearer instance used by the route shares the token decoded
+        # and checked against the blocklist by the first one
+        token_data = getattr(request.state, "token_data", None)
         
-        if not token_data:
-            raise InvalidTokenException()
+        if token_data is None:
+            creds = await super().__call__(request)
+            # get the token in auth header automatically
+            token = creds.credentials
+
+            token_data = self.token_valid(token)
             
-        if await token_in_blocklist(token_data["jti"]):
-            raise InvalidTokenException()
+            if not token_data:
+                raise InvalidTokenException()
+                
+            if await token_in_blocklist(token_data["jti"]):
+                raise InvalidTokenException()
+                
+            request.state.token_data = token_data
             
         self.verify_token_data(token_data)
         
@@ -61,20 +68,42 @@ class RefreshTokenBearer(TokenBearer):
         if token_data and not token_data["refresh"]:
             raise RefreshTokenRequiredException()
             
-async def get_current_user(
+async def get_principal(
+    request: Request,
     token_details: dict = Depends(AccessTokenBearer()),
     session: AsyncSession = Depends(get_session)
-):
-    user_email = token_details["user"]["email"]
-    user = await user_service.get_user_by_email(user_email, session)
-    return user
+) -> Principal:
+    principal = getattr(request.state, "principal", None)
+    
+    if principal is None:
+        user_data = token_details["user"]
+        role = user_data.get("role")
+        
+        if role is None:
+            # tokens issued before the role claim was added need the identity lookup
+            identity = await user_service.get_user_identity(user_data["email"], session)
+            
+            if identity is None:
+                raise UserNotFoundException()
+                
+            role = identity.role
+            
+        principal = Principal(
+            uid=user_data["user_uid"],
+            email=user_data["email"],
+            role=role
+        )
+        request.state.principal = principal
+        
+    return principal
 
 class RoleChecker:
     def __init__(self, allowed_roles: List[str]) -> None:
         self.allowed_roles = allowed_roles
         
-    def __call__(self, current_user: UserModel = Depends(get_current_user)) -> Any:
-        if current_user.role in self.allowed_roles:
+    def __call__(self, principal: Principal = Depends(get_principal)) -> Any:
+        # answered from the token claims without touching the database
+        if principal.role in self.allowed_roles:
             return True
         
         raise InsufficientPermissionException()
\ No newline at end of file
@@ -3,27 +3,30 @@ from datetime import timedelta, datetime
 from fastapi import APIRouter, Depends, status
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import HTTPException
+import uuid
 
 from sqlmodel.ext.asyncio.session import AsyncSession
 from pydantic import BaseModel, Field
 
 from src.errors import (
     UserAlreadyExistsException,
+    UserNotFoundException,
     InvalidTokenException,
     RefreshTokenRequiredException,
     InvalidCredentialsException
     
 )
 
-from .schemas import UserCreateModel, UserModel, UserBooksModel
+from .schemas import Principal, UserCreateModel, UserModel, UserBooksModel, UserRoleUpdateModel
 from .service import UserService
 from src.db.main import get_session
 from src.db.redis import add_jti_to_blocklist
-from .utils import create_access_token, verify_password
+from .utils import create_access_token, verify_password_async
 from src.config import Config 
-from .dependencies import RefreshTokenBearer, AccessTokenBearer, get_current_user, RoleChecker
+from .dependencies import RefreshTokenBearer, AccessTokenBearer, get_principal, RoleChecker
 
-from src.mail import mail, create_message
+from src.mail_dispatch import mail_dispatcher
+from src.mail_templates import mail_templates
 from src.auth.schemas import EmailModel
 
 auth_router = APIRouter()
@@ -63,17 +66,18 @@ async def login_users(
     if user is None:
         raise InvalidCredentialsException()
 
-    password_valid = verify_password(password, user.password_hash)
+    password_valid = await verify_password_async(password, user.password_hash)
     
     if not password_valid:
         raise InvalidCredentialsException()
         
+    # the role claim lets role checks skip the database
     access_token = create_access_token(
-        user_data={"email": user.email, "user_uid": str(user.uid)}
+        user_data={"email": user.email, "user_uid": str(user.uid), "role": user.role}
     )
             
     refresh_token = create_access_token(
-        user_data={"email": user.email, "user_uid": str(user.uid)},
+        user_data={"email": user.email, "user_uid": str(user.uid), "role": user.role},
         refresh=True,
         expiry=timedelta(days=Config.REFRESH_TOKEN_EXPIRY)
     )
@@ -91,19 +95,51 @@ async def login_users(
     )
     
 @auth_router.get("/me", response_model=UserBooksModel)
-async def get_current_user(user=Depends(get_current_user), _: bool = Depends(role_checker_admin)):
+async def get_current_user(
+    principal: Principal = Depends(get_principal),
+    session: AsyncSession = Depends(get_session),
+    _: bool = Depends(role_checker_admin)
+):
+    # the only response with the books of a user, so the only place loading them
+    user = await user_service.get_user_with_books(principal.email, session)
+    
+    if user is None:
+        raise UserNotFoundException()
+        
+    return user
+
+@auth_router.patch("/users/{user_uid}/role", response_model=UserModel, dependencies=[Depends(role_checker_admin)])
+async def update_user_role(
+    user_uid: uuid.UUID,
+    role_data: UserRoleUpdateModel,
+    session: AsyncSession = Depends(get_session)
+):
+    user = await user_service.update_user_role(user_uid, role_data.role.value, session)
+    
+    if user is None:
+        raise UserNotFoundException()
+        
     return user
 
 @auth_router.get("/refresh_token")
 async def get_new_access_token(
-    token_details: dict = Depends(RefreshTokenBearer())
+    token_details: dict = Depends(RefreshTokenBearer()),
+    session: AsyncSession = Depends(get_session)
 ):
     expiry_timestamp = token_details["exp"]
     
     if datetime.fromtimestamp(expiry_timestamp) > datetime.now():
+        user_data = token_details["user"]
+        
+        # read the role again so a role change is picked up within one access token lifetime
+        user = await user_service.get_user_identity(user_data["email"], session)
+        
+        if user is None:
+            raise InvalidTokenException()
+            
         # create a new access token if the refresh token has not expired yet.
         new_access_token = create_access_token(
-            user_data=token_details["user"]
+            user_data={**user_data, "role": user.role}
         )
         return JSONResponse(
             content={"access_token": new_access_token}
@@ -124,19 +160,25 @@ async def revoke_token(token_details: dict = Depends(AccessTokenBearer())):
         status_code=status.HTTP_200_OK
     )
     
-@auth_router.post("/send_mail")
+@auth_router.post("/send_mail", status_code=status.HTTP_202_ACCEPTED)
 async def send_mail(emails: EmailModel):
     emails_list = emails.addresses
     
-    html = "<h1>Welcome to our FastAPI app</h1>"
+    # the same body for every recipient, rendered once and then served from the render cache
+    html = mail_templates.render("welcome.html", {}, locale=emails.locale)
     subject = "Welcome"
 
-    message = create_message(
+    # delivered in the background by the mail workers
+    job_id = await mail_dispatcher.enqueue(
         recipients=emails_list,
         subject=subject,
         body=html
     )
     
-    await mail.send_message(message)
-    
-    return {"message": "Email sent successfully."}
\ No newline at end of file
+    return JSONResponse(
+        content={
+            "message": "Email queued for delivery.",
+            "job_id": job_id
+        },
+        status_code=status.HTTP_202_ACCEPTED
+    )
\ No newline at end of file
@@ -3,7 +3,7 @@ import uuid
 from datetime import datetime
 from enum import Enum
 from src.books.schemas import BookSchema
-from typing import List
+from typing import List, Optional
 
 class UserRole(str, Enum):
     admin = "admin"
@@ -17,6 +17,9 @@ class UserCreateModel(BaseModel):
     last_name: str = Field(max_length=30)
     role: UserRole = Field(default=UserRole.user)
     
+class UserRoleUpdateModel(BaseModel):
+    role: UserRole
+    
 class UserModel(BaseModel):
     uid: uuid.UUID
     username: str
@@ -28,8 +31,20 @@ class UserModel(BaseModel):
     created_at: datetime
     role: str
     
+class Principal(BaseModel):
+    """
+    Identity of the caller resolved once per request from the access token.
+    The role comes from the token claims so it can be up to one access token
+    lifetime stale, the refresh endpoint reads the current role again.
+    """
+    uid: uuid.UUID
+    email: str
+    role: str
+    
 class UserBooksModel(UserModel):
     books: List[BookSchema]
     
 class EmailModel(BaseModel):
-    addresses: List[str]
\ No newline at end of file
+    addresses: List[str]
+    # language of the mail, the default locale when not given
+    locale: Optional[str] = None
\ No newline at end of file
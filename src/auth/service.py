@@ -1,8 +1,11 @@
-from src.db.models import User
+from src.db.models import Book, User
 from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.orm import selectinload
 import sqlmodel
-from .schemas import UserCreateModel
-from .utils import generate_passwd_hash
+import uuid
+from .cache import user_identity_cache
+from .schemas import UserCreateModel, Principal
+from .utils import generate_passwd_hash_async
 
 class UserService:
     async def get_user_by_email(self, email: str, session: AsyncSession):
@@ -14,8 +17,42 @@ class UserService:
         
         return user
     
+    async def get_user_with_books(self, email: str, session: AsyncSession):
+        """
+        Get a user with the books they added and the tags of those books
+        """
+        statement = sqlmodel.select(User).where(User.email == email).options(
+            selectinload(User.books).selectinload(Book.tags)
+        )
+        
+        result = await session.exec(statement)
+        
+        return result.first()
+    
+    async def get_user_identity(self, email: str, session: AsyncSession) -> Principal | None:
+        """
+        Get the uid, email and role of a user, served from the identity cache when possible
+        """
+        identity = await user_identity_cache.get(email)
+        
+        if identity is None:
+            statement = sqlmodel.select(User.uid, User.email, User.role).where(User.email == email)
+            
+            result = await session.exec(statement)
+            
+            row = result.first()
+            
+            if row is None:
+                return None
+                
+            identity = Principal(uid=row.uid, email=row.email, role=row.role)
+            
+            await user_identity_cache.set(identity)
+            
+        return identity
+    
     async def user_exists(self, email: str, session: AsyncSession):
-        user = await self.get_user_by_email(email, session)
+        user = await self.get_user_identity(email, session)
         
         return True if user is not None else False
     
@@ -26,7 +63,7 @@ class UserService:
             **user_data_dict
         )
         
-        new_user.password_hash = generate_passwd_hash(
+        new_user.password_hash = await generate_passwd_hash_async(
             user_data_dict["password"]
         )
         
@@ -34,4 +71,24 @@ class UserService:
         
         await session.commit()
         
-        return new_user # response model xa so no dump here
\ No newline at end of file
+        await user_identity_cache.invalidate(new_user.email)
+        
+        return new_user # response model xa so no dump here
+    
+    async def update_user_role(self, user_uid: uuid.UUID, role: str, session: AsyncSession):
+        statement = sqlmodel.select(User).where(User.uid == user_uid)
+        
+        result = await session.exec(statement)
+        
+        user = result.first()
+        
+        if user is None:
+            return None
+            
+        user.role = role
+        
+        await session.commit()
+        
+        await user_identity_cache.invalidate(user.email)
+        
+        return user
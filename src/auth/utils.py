@@ -1,9 +1,15 @@
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import time
 import uuid
 
 from passlib.context import CryptContext
 import jwt
 from src.config import Config
+from src.cache import TTLCache
+from src.metrics import PASSWORD_HASH_IN_FLIGHT, PASSWORD_HASH_QUEUE_TIME, PASSWORD_HASH_TIME
 import logging
 
 passwd_context = CryptContext(
@@ -18,6 +24,38 @@ def generate_passwd_hash(password: str) -> str:
 def verify_password(password: str, hash: str) -> bool:
     return passwd_context.verify(password, hash)
 
+# bcrypt releases the GIL while hashing, so the workers hash in parallel while
+# the event loop keeps serving other requests. the worker count bounds how many
+# hashes run at once, the rest wait in the executor queue.
+password_hash_executor = ThreadPoolExecutor(
+    max_workers=Config.PASSWORD_HASH_WORKERS, thread_name_prefix="passwd_hash"
+)
+
+async def run_password_hashing(func, *args):
+    """Run a bcrypt call in the password hash pool and record how long it waited."""
+    submitted_at = time.perf_counter()
+    
+    def timed_call():
+        started_at = time.perf_counter()
+        result = func(*args)
+        return result, started_at - submitted_at, time.perf_counter() - started_at
+    
+    with PASSWORD_HASH_IN_FLIGHT.track_inprogress():
+        result, queue_seconds, hash_seconds = await asyncio.get_running_loop().run_in_executor(
+            password_hash_executor, timed_call
+        )
+        
+    PASSWORD_HASH_QUEUE_TIME.observe(queue_seconds)
+    PASSWORD_HASH_TIME.observe(hash_seconds)
+    
+    return result
+
+async def generate_passwd_hash_async(password: str) -> str:
+    return await run_password_hashing(generate_passwd_hash, password)
+
+async def verify_password_async(password: str, hash: str) -> bool:
+    return await run_password_hashing(verify_password, password, hash)
+
 def create_access_token(user_data: dict, expiry: timedelta = None, refresh: bool = False) -> str:
     payload = {
         "user" : user_data,
@@ -34,13 +72,30 @@ def create_access_token(user_data: dict, expiry: timedelta = None, refresh: bool
     
     return token
 
+# verified claims by token digest, an entry never outlives the exp of its token.
+# revocation is not cached here, callers still check the blocklist.
+verified_token_cache = TTLCache(maxsize=Config.TOKEN_CACHE_SIZE, ttl=Config.TOKEN_CACHE_TTL, name="verified_token")
+
 def decode_token(token: str) -> dict:
+    token_digest = hashlib.sha256(token.encode()).digest()
+    token_data = verified_token_cache.get(token_digest)
+    
+    if token_data is not None:
+        return token_data
+    
     try:
         token_data = jwt.decode(
             jwt=token,
             key=Config.JWT_SECRET,
             algorithms=[Config.JWT_ALGORITHM]
         )
+        
+        # pyjwt checks exp against the current unix time, so does the cache.
+        # tokens without exp are not cached.
+        if "exp" in token_data:
+            verified_token_cache.set(
+                token_digest, token_data, ttl=min(token_data["exp"] - time.time(), Config.TOKEN_CACHE_TTL)
+            )
                 
         return token_data
     
@@ -54,4 +109,4 @@ def decode_token(token: str) -> dict:
     
     except Exception as e:
         logging.exception(e)
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,45 @@
+import csv
+import io
+from typing import AsyncIterator, List
+
+from src.responses import dumps
+
+EXPORT_FIELDS = [
+    "uid",
+    "title",
+    "author",
+    "publisher",
+    "published_date",
+    "page_count",
+    "language",
+    "user_uid",
+    "created_at",
+    "updated_at",
+    "tags",
+    "review_count",
+    "avg_rating",
+]
+
+async def ndjson_chunks(chunks: AsyncIterator[List[dict]]) -> AsyncIterator[bytes]:
+    """Encode every chunk of books as newline delimited json, one book per line."""
+    async for books in chunks:
+        yield b"".join(dumps(book) + b"\n" for book in books)
+
+async def csv_chunks(chunks: AsyncIterator[List[dict]]) -> AsyncIterator[str]:
+    """Encode every chunk of books as csv rows, tags are joined with |."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+
+    async for books in chunks:
+        for book in books:
+            writer.writerow({**book, "tags": "|".join(book["tags"])})
+
+        yield buffer.getvalue()
+
+        buffer.seek(0)
+        buffer.truncate()
+
+    # only the header is left when there are no books
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,41 @@
+from typing import NamedTuple, Optional, Tuple
+
+from src.books.schemas import BookSchema
+from src.errors import InvalidFieldsException
+
+# the relations of BookSchema that can be asked for with include
+BOOK_INCLUDES = ("tags",)
+# the columns of BookSchema that can be asked for with fields, in response order
+BOOK_FIELDS = tuple(name for name in BookSchema.model_fields if name not in BOOK_INCLUDES)
+
+class BookFieldSet(NamedTuple):
+    """Columns and relations of the books a listing has to fetch and return."""
+    fields: Tuple[str, ...] = BOOK_FIELDS
+    include: Tuple[str, ...] = BOOK_INCLUDES
+
+def _parse(value: str, allowed: Tuple[str, ...]) -> Tuple[str, ...]:
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+
+    if not requested or not requested.issubset(allowed):
+        raise InvalidFieldsException()
+
+    # the schema order, so the same set always gives the same response and cache key
+    return tuple(name for name in allowed if name in requested)
+
+def parse_fieldset(fields: Optional[str], include: Optional[str]) -> BookFieldSet:
+    """
+    Build the field set of a listing from the fields and include query parameters.
+
+    Without either parameter the whole BookSchema is returned. Once fields is
+    given the relations are only returned when include asks for them.
+
+    Raises:
+        InvalidFieldsException: a name is not a field or relation of BookSchema
+    """
+    if fields is None and include is None:
+        return BookFieldSet()
+
+    return BookFieldSet(
+        fields=BOOK_FIELDS if fields is None else _parse(fields, BOOK_FIELDS),
+        include=_parse(include, BOOK_INCLUDES) if include else ()
+    )
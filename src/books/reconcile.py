@@ -0,0 +1,26 @@
+"""
+Recompute the rating aggregates of the books from their reviews.
+
+    python -m src.books.reconcile
+
+The aggregates are adjusted with every review write, this corrects any drift
+left by writes made outside of the services (manual fixes, imports). Run it
+from cron, it only writes the books whose aggregates are off.
+"""
+import asyncio
+import logging
+
+from src.books.service import BookService
+from src.db.main import async_session_maker, db_connect
+
+async def reconcile() -> int:
+    async with async_session_maker() as session:
+        corrected = await BookService().reconcile_ratings(session)
+
+    await db_connect.dispose()
+
+    return len(corrected)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logging.info("rating aggregates corrected on %d book(s)", asyncio.run(reconcile()))
@@ -2,11 +2,38 @@ from fastapi import status
 from fastapi import APIRouter
 from fastapi import HTTPException
 from fastapi import Depends
+from fastapi import Query
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
 
 from src.books.book_data import books
-from src.books.schemas import BookSchema, BookUpdateModel, BookCreateModel
+from src.books.schemas import (
+    BookSchema,
+    BookPageSchema,
+    BookUpdateModel,
+    BookCreateModel,
+    BookBatchCreateModel,
+    BookBatchResultSchema,
+    BookSearchPageSchema,
+    BookRatedSchema,
+    ExportFormat
+)
 from src.books.service import BookService
-from src.db.main import get_session
+from src.books.export import csv_chunks, ndjson_chunks
+from src.books.fieldsets import BOOK_FIELDS, BOOK_INCLUDES, parse_fieldset
+from src.books.serializers import (
+    book_detail_to_dict,
+    book_list_to_dict,
+    book_page_to_dict,
+    book_search_page_to_dict,
+    book_to_dict
+)
+from src.cache import response_cache
+from src.conditional import is_not_modified, make_etag, not_modified, validator_headers
+from src.db.main import get_session, async_session_maker, query_budget
+from src.db.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from src.responses import FastJSONResponse, dumps
+from src.reviews.service import ReviewService
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.auth.dependencies import AccessTokenBearer
 from src.auth.dependencies import RoleChecker
@@ -17,23 +44,143 @@ from src.errors import (
     BookNotFoundException
 )
 
-from typing import List
+from typing import List, Optional
 
-book_router = APIRouter()
+book_router = APIRouter(dependencies=[Depends(query_budget(10))])
 book_service = BookService()
+review_service = ReviewService()
 access_token_bearer = AccessTokenBearer()
 role_checker_admin = Depends(RoleChecker(["admin"]))
 role_checker_user = Depends(RoleChecker(["user","admin"]))
 
-# Returns all the books (GET)
+FIELDS_DESCRIPTION = f"Comma separated book fields to return, any of {', '.join(BOOK_FIELDS)}"
+INCLUDE_DESCRIPTION = (
+    f"Comma separated relations to return, any of {', '.join(BOOK_INCLUDES)}. "
+    "Without fields and include the whole book is returned"
+)
+
+# Returns a page of the books (GET)
 # Set the dependencies in the http call
-@book_router.get("/", response_model=List[BookSchema], dependencies=[role_checker_user])
+@book_router.get("/", response_model=BookPageSchema, dependencies=[role_checker_user])
 async def get_all_books(
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(default=None, description=FIELDS_DESCRIPTION),
+    include: Optional[str] = Query(default=None, description=INCLUDE_DESCRIPTION),
     session: AsyncSession = Depends(get_session),
     token_details = Depends(access_token_bearer)
 ):
-    books = await book_service.get_all_books(session)
-    return books
+    fieldset = parse_fieldset(fields, include)
+    
+    async def books_page_json():
+        books_page = await book_service.get_all_books(
+            session, limit=limit, cursor=cursor, fieldset=fieldset
+        )
+        return dumps(book_page_to_dict(books_page["items"], books_page["next_cursor"], fieldset))
+    
+    content = await response_cache.get_or_compute(
+        "books",
+        {"limit": limit, "cursor": cursor, "fields": fieldset.fields, "include": fieldset.include},
+        books_page_json
+    )
+    return Response(content=content, media_type="application/json")
+
+# Returns a page of the books added by a user (GET)
+@book_router.get("/user/{user_uid}", response_model=BookPageSchema, dependencies=[role_checker_user])
+async def get_user_book_submissions(
+    user_uid: uuid.UUID,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(default=None, description=FIELDS_DESCRIPTION),
+    include: Optional[str] = Query(default=None, description=INCLUDE_DESCRIPTION),
+    session: AsyncSession = Depends(get_session),
+    token_details = Depends(access_token_bearer)
+):
+    fieldset = parse_fieldset(fields, include)
+    
+    async def books_page_json():
+        books_page = await book_service.get_user_books(
+            user_uid, session, limit=limit, cursor=cursor, fieldset=fieldset
+        )
+        return dumps(book_page_to_dict(books_page["items"], books_page["next_cursor"], fieldset))
+    
+    content = await response_cache.get_or_compute(
+        "books",
+        {
+            "user_uid": user_uid,
+            "limit": limit,
+            "cursor": cursor,
+            "fields": fieldset.fields,
+            "include": fieldset.include
+        },
+        books_page_json
+    )
+    return Response(content=content, media_type="application/json")
+
+# Stream the whole catalog as ndjson or csv (GET)
+@book_router.get("/export", dependencies=[role_checker_user])
+async def export_books(
+    format: ExportFormat = ExportFormat.ndjson,
+    token_details = Depends(access_token_bearer)
+):
+    async def book_chunks():
+        # the request session is closed before the body is streamed so the
+        # export reads the catalog with its own session
+        async with async_session_maker() as session:
+            async for books in book_service.stream_books(session):
+                yield books
+                
+    if format == ExportFormat.csv:
+        return StreamingResponse(
+            csv_chunks(book_chunks()),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="books.csv"'}
+        )
+        
+    return StreamingResponse(ndjson_chunks(book_chunks()), media_type="application/x-ndjson")
+
+# Full text search over title, author and publisher (GET)
+@book_router.get("/search", response_model=BookSearchPageSchema, dependencies=[role_checker_user])
+async def search_books(
+    q: str = Query(min_length=1, max_length=200, description="Words to search, web search syntax"),
+    language: Optional[str] = None,
+    tag: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
+    token_details = Depends(access_token_bearer)
+):
+    async def search_page_json():
+        search_page = await book_service.search_books(
+            q, session, limit=limit, cursor=cursor, language=language, tag=tag
+        )
+        return dumps(book_search_page_to_dict(search_page["items"], search_page["next_cursor"]))
+    
+    content = await response_cache.get_or_compute(
+        "books",
+        {"q": q, "language": language, "tag": tag, "limit": limit, "cursor": cursor},
+        search_page_json
+    )
+    return Response(content=content, media_type="application/json")
+
+# The best rated books (GET)
+@book_router.get("/top-rated", response_model=List[BookRatedSchema], dependencies=[role_checker_user])
+async def get_top_rated_books(
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    min_reviews: int = Query(default=1, ge=1, description="Leave out the books with fewer reviews"),
+    session: AsyncSession = Depends(get_session),
+    token_details = Depends(access_token_bearer)
+):
+    async def top_rated_json():
+        books = await book_service.get_top_rated_books(session, limit=limit, min_reviews=min_reviews)
+        return dumps(book_list_to_dict(books))
+    
+    content = await response_cache.get_or_compute(
+        "books",
+        {"top_rated": True, "limit": limit, "min_reviews": min_reviews},
+        top_rated_json
+    )
+    return Response(content=content, media_type="application/json")
 
 # Post a new book (POST)
 @book_router.post("/", status_code=status.HTTP_201_CREATED,  dependencies = [role_checker_admin])
@@ -44,21 +191,64 @@ async def create_a_book(
 ) -> dict:
     user_id = token_details.get("user")["user_uid"]
     new_book = await book_service.create_book(book_data, user_uid=user_id, session=session)
-    # TODO: Any nice to do here why?
-    return new_book.model_dump()
+    return FastJSONResponse(book_to_dict(new_book), status_code=status.HTTP_201_CREATED)
+
+# Post many books at once (POST)
+@book_router.post(
+    "/batch",
+    response_model=BookBatchResultSchema,
+    status_code=status.HTTP_201_CREATED,
+    # one INSERT per chunk of the batch, the statement count grows with the batch
+    dependencies=[role_checker_admin, Depends(query_budget(None))]
+)
+async def create_books(
+    batch_data: BookBatchCreateModel,
+    session: AsyncSession = Depends(get_session),
+    token_details = Depends(access_token_bearer)
+):
+    user_id = token_details.get("user")["user_uid"]
+    result = await book_service.create_books(batch_data.books, user_uid=user_id, session=session)
+    
+    if not result["created"]:
+        # nothing was created, every book is invalid
+        return FastJSONResponse(result, status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+    return FastJSONResponse(result, status_code=status.HTTP_201_CREATED)
 
 # Return a single book (GET)
 @book_router.get("/{book_uuid}", dependencies = [role_checker_user])
 async def get_book(
     book_uuid: uuid.UUID,
+    request: Request,
     session: AsyncSession = Depends(get_session),
     token_details = Depends(access_token_bearer)
 ) -> dict:
-    book = await book_service.get_book(book_uuid, session)
+    # the version stamp alone answers revalidations, the book is not loaded
+    version = await book_service.get_book_version(book_uuid, session)
+    headers = {}
+    
+    if version is not None:
+        etag = make_etag("book", book_uuid, version.isoformat())
+        headers = validator_headers(etag, version)
+        
+        if is_not_modified(request, etag, version):
+            return not_modified(headers)
+    
+    async def book_json():
+        book = await book_service.get_book(book_uuid, session)
+        
+        if book is None:
+            return None
+        
+        # only the first page of the reviews, a popular book has too many to embed
+        reviews_page = await review_service.get_book_reviews(book_uuid, session)
+        
+        return dumps(book_detail_to_dict(book, reviews_page["items"], reviews_page["next_cursor"]))
+    
+    content = await response_cache.get_or_compute(f"book:{book_uuid}", {}, book_json)
     
-    if book:
-        # TODO: Here also
-        return book.model_dump()
+    if content is not None:
+        return Response(content=content, media_type="application/json", headers=headers)
     else:
         raise BookNotFoundException()
 
@@ -75,7 +265,7 @@ async def update_book(
     if updated_book is None:
         raise BookNotFoundException()
     else:
-        return updated_book
+        return FastJSONResponse(book_to_dict(updated_book))
 
 # Delete a book in book list (DELETE)
 @book_router.delete("/{book_uuid}", status_code=status.HTTP_204_NO_CONTENT)
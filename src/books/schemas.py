@@ -1,7 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import uuid
-from typing import Optional, List
-from src.reviews.schemas import ReviewModel
+from enum import Enum
+from typing import Any, Dict, Optional, List
 from src.tags.schemas import TagModel
 
 class BookSchema(BaseModel):
@@ -13,9 +13,47 @@ class BookSchema(BaseModel):
     page_count: int
     language: str
     user_uid: Optional[uuid.UUID]
-    reviews: List[ReviewModel] = []
+    # sum up the reviews, pages of them are on GET /reviews/book/{uid}
+    review_count: int = 0
+    # None while the book has no review
+    avg_rating: Optional[float] = None
     tags: List[TagModel] = []
     
+class BookPageSchema(BaseModel):
+    items: List[BookSchema]
+    # pass it as the cursor query parameter to get the next page, None on the last page
+    next_cursor: Optional[str] = None
+    
+class BookSearchItemSchema(BaseModel):
+    uid: uuid.UUID
+    title: str
+    author: str
+    publisher: str
+    published_date: str
+    page_count: int
+    language: str
+    user_uid: Optional[uuid.UUID]
+    review_count: int = 0
+    avg_rating: Optional[float] = None
+    # relevance of the book for the query, higher is better
+    rank: float
+    
+class BookSearchPageSchema(BaseModel):
+    items: List[BookSearchItemSchema]
+    next_cursor: Optional[str] = None
+    
+class BookRatedSchema(BaseModel):
+    uid: uuid.UUID
+    title: str
+    author: str
+    publisher: str
+    published_date: str
+    page_count: int
+    language: str
+    user_uid: Optional[uuid.UUID]
+    review_count: int
+    avg_rating: float
+    
 class BookUpdateModel(BaseModel):
     title: Optional[str] = None
     author: Optional[str] = None
@@ -32,4 +70,31 @@ class BookCreateModel(BaseModel):
     publisher: str
     published_date: str
     page_count: int
-    language: str
\ No newline at end of file
+    language: str
+    
+# largest number of books accepted by one batch request
+MAX_BOOK_BATCH_SIZE = 5000
+
+class BookBatchCreateModel(BaseModel):
+    """
+    The items are validated one by one by the service so an invalid book is
+    reported in the result instead of rejecting the whole batch
+    """
+    books: List[Dict[str, Any]] = Field(min_length=1, max_length=MAX_BOOK_BATCH_SIZE)
+    
+class BookBatchCreatedSchema(BaseModel):
+    # position of the book in the request
+    index: int
+    uid: uuid.UUID
+    
+class BookBatchErrorSchema(BaseModel):
+    index: int
+    errors: List[Dict[str, Any]]
+    
+class BookBatchResultSchema(BaseModel):
+    created: List[BookBatchCreatedSchema]
+    errors: List[BookBatchErrorSchema]
+    
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
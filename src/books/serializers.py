@@ -0,0 +1,94 @@
+from typing import Optional, Sequence
+
+from src.books.fieldsets import BookFieldSet
+from src.db.models import Book, Review
+from src.reviews.serializers import review_page_to_dict
+from src.tags.serializers import tag_to_dict
+
+# the rows come from the database so they already satisfy the schemas, building
+# plain dicts for orjson skips the validation and the jsonable_encoder pass.
+
+# the search results and the top rated books carry the columns of BookSchema, not the relations
+SCALAR_FIELDSET = BookFieldSet(include=())
+
+def book_to_dict(book: Book) -> dict:
+    """Same fields and order as Book.model_dump(), relationships and rating_sum are left out"""
+    return {
+        "uid": book.uid,
+        "title": book.title,
+        "author": book.author,
+        "publisher": book.publisher,
+        "published_date": book.published_date,
+        "page_count": book.page_count,
+        "language": book.language,
+        "user_uid": book.user_uid,
+        "created_at": book.created_at,
+        "updated_at": book.updated_at,
+        "review_count": book.review_count,
+        "avg_rating": book.avg_rating,
+    }
+
+def book_detail_to_dict(book: Book, reviews: Sequence[Review], next_cursor: Optional[str]) -> dict:
+    """
+    book_to_dict with the first page of the reviews, review_count and avg_rating
+    sum up all of them and next_cursor continues on GET /reviews/book/{uid}
+    """
+    return {
+        **book_to_dict(book),
+        "reviews": review_page_to_dict(reviews, next_cursor),
+    }
+
+def book_schema_to_dict(book: Book) -> dict:
+    """Same fields and order as BookSchema, with the tags"""
+    return {
+        "uid": book.uid,
+        "title": book.title,
+        "author": book.author,
+        "publisher": book.publisher,
+        "published_date": book.published_date,
+        "page_count": book.page_count,
+        "language": book.language,
+        "user_uid": book.user_uid,
+        "review_count": book.review_count,
+        "avg_rating": book.avg_rating,
+        "tags": [tag_to_dict(tag) for tag in book.tags],
+    }
+
+def book_fieldset_to_dict(book: Book, fieldset: BookFieldSet) -> dict:
+    """Only the fields and relations of the field set, in BookSchema order"""
+    data = {name: getattr(book, name) for name in fieldset.fields}
+    
+    if "tags" in fieldset.include:
+        data["tags"] = [tag_to_dict(tag) for tag in book.tags]
+        
+    return data
+
+def book_page_to_dict(
+    items: Sequence[Book],
+    next_cursor: Optional[str],
+    fieldset: BookFieldSet = BookFieldSet()
+) -> dict:
+    """Same fields and order as BookPageSchema, narrowed to the field set"""
+    if fieldset == BookFieldSet():
+        books = [book_schema_to_dict(book) for book in items]
+    else:
+        books = [book_fieldset_to_dict(book, fieldset) for book in items]
+        
+    return {
+        "items": books,
+        "next_cursor": next_cursor,
+    }
+
+def book_search_page_to_dict(rows: Sequence[tuple], next_cursor: Optional[str]) -> dict:
+    """Same fields and order as BookSearchPageSchema, rows are (book, rank)"""
+    return {
+        "items": [
+            {**book_fieldset_to_dict(book, SCALAR_FIELDSET), "rank": rank}
+            for book, rank in rows
+        ],
+        "next_cursor": next_cursor,
+    }
+
+def book_list_to_dict(books: Sequence[Book]) -> list:
+    """Same fields and order as a list of BookRatedSchema"""
+    return [book_fieldset_to_dict(book, SCALAR_FIELDSET) for book in books]
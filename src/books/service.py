@@ -1,25 +1,126 @@
 from sqlmodel.ext.asyncio.session import AsyncSession
-from src.db.models import Book
+from src.cache import response_cache
+from src.db.models import BOOK_SEARCH_CONFIG, Book, BookTag, Review, Tag, book_search_vector
+from src.db.pagination import DEFAULT_PAGE_SIZE, encode_cursor, decode_cursor
+from src.books.fieldsets import BookFieldSet
 from src.books.schemas import BookCreateModel, BookUpdateModel
+from src.errors import InvalidCursorException
 import sqlmodel
 from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
 import uuid
-from sqlalchemy.orm import selectinload
+from pydantic import ValidationError
+from sqlalchemy import func, insert, tuple_, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import load_only, selectinload
+
+EXPORT_CHUNK_SIZE = 1000
+# books recomputed per transaction by reconcile_ratings
+RECONCILE_BATCH_SIZE = 5000
+# rows per multi-row INSERT, 1000 rows of books stay well under the 32767 bind parameters of postgres
+INSERT_CHUNK_SIZE = 1000
+# the relationships nested in BookSchema, the models never load them on their own
+BOOK_RELATIONS = (selectinload(Book.tags),)
+
+def book_fieldset_options(fieldset: BookFieldSet) -> list:
+    """
+    Loader options fetching only the columns and relations of a field set
+    
+    created_at is always loaded for the keyset cursor and uid (the primary key)
+    to attach the relations, other columns are not selected at all.
+    """
+    columns = {"uid", "created_at", *fieldset.fields}
+    options = [load_only(*(getattr(Book, name) for name in columns), raiseload=True)]
+    
+    if "tags" in fieldset.include:
+        options.append(selectinload(Book.tags))
+        
+    return options
 
 class BookService:
     """
     This class provides methods to create, read, update and delete book
     """
-    async def get_all_books(self, session: AsyncSession):
+    async def get_all_books(
+        self,
+        session: AsyncSession,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        fieldset: BookFieldSet = BookFieldSet()
+    ):
         """
-        Get a list of all books
+        Get a page of books, newest first
         
+        Args:
+            limit (int): maximum number of books in the page
+            cursor (str): next_cursor of the previous page, None for the first page
+            fieldset (BookFieldSet): the columns and relations to fetch, all of BookSchema by default
+            
         Returns:
-            list: list of books
+            dict: the books of the page and the cursor of the next page
         """
-        statement = sqlmodel.select(Book).order_by(sqlmodel.desc(Book.created_at))
+        statement = sqlmodel.select(Book).options(*book_fieldset_options(fieldset))
+        return await self._get_books_page(statement, limit, cursor, session)
+    
+    async def stream_books(
+        self,
+        session: AsyncSession,
+        chunk_size: int = EXPORT_CHUNK_SIZE
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Stream the whole catalog, newest first, in chunks of plain dicts
+        
+        Rows are read through a server side cursor so only one chunk is held in
+        memory at a time. Tag names are fetched with one query per chunk instead
+        of loading the relationships of every book.
+        
+        Args:
+            chunk_size (int): number of books fetched from the cursor at once
+            
+        Yields:
+            list: the books of the chunk
+        """
+        statement = sqlmodel.select(
+            Book.uid,
+            Book.title,
+            Book.author,
+            Book.publisher,
+            Book.published_date,
+            Book.page_count,
+            Book.language,
+            Book.user_uid,
+            Book.created_at,
+            Book.updated_at,
+            Book.review_count,
+            Book.avg_rating
+        ).order_by(sqlmodel.desc(Book.created_at), sqlmodel.desc(Book.uid))
+        
+        result = await session.stream(statement.execution_options(yield_per=chunk_size))
+        
+        async for rows in result.partitions(chunk_size):
+            books = [row._asdict() for row in rows]
+            book_uids = [book["uid"] for book in books]
+            
+            tag_names = await self._get_tag_names(book_uids, session)
+            
+            for book in books:
+                book["tags"] = tag_names.get(book["uid"], [])
+                
+            yield books
+            
+    async def _get_tag_names(self, book_uids: List[uuid.UUID], session: AsyncSession) -> Dict[uuid.UUID, List[str]]:
+        statement = (
+            sqlmodel.select(BookTag.book_id, Tag.name)
+            .join(Tag, Tag.uid == BookTag.tag_id)
+            .where(BookTag.book_id.in_(book_uids))
+        )
         result = await session.exec(statement)
-        return result.all()
+        
+        tag_names = {}
+        for book_uid, name in result.all():
+            tag_names.setdefault(book_uid, []).append(name)
+            
+        return tag_names
     
     async def create_book(self, book_data: BookCreateModel, user_uid: uuid.UUID, session: AsyncSession):
         """
@@ -46,40 +147,383 @@ class BookService:
         
         await session.commit()
         
+        await response_cache.invalidate("books")
+        
         return new_book
     
-    async def get_user_books(self, user_uid: uuid.UUID, session: AsyncSession):
+    async def create_books(
+        self,
+        books_data: List[dict],
+        user_uid: uuid.UUID,
+        session: AsyncSession,
+        chunk_size: int = INSERT_CHUNK_SIZE
+    ):
+        """
+        Create many books in one transaction
+        
+        Every item is validated as a BookCreateModel, the valid ones are inserted
+        with multi-row INSERT ... RETURNING statements of chunk_size rows. A chunk
+        the database refuses is retried row by row so only the failing books are
+        left out.
+        
+        Args:
+            books_data (list): the books to create as sent by the client
+            
+        Returns:
+            dict: index and uid of the created books and the errors of the others by index
+        """
+        errors = []
+        rows = []
+        
+        for index, item in enumerate(books_data):
+            try:
+                book_data = BookCreateModel.model_validate(item)
+            except ValidationError as e:
+                errors.append({
+                    "index": index,
+                    "errors": e.errors(include_url=False, include_context=False, include_input=False)
+                })
+                continue
+                
+            rows.append((index, {**book_data.model_dump(), "uid": uuid.uuid4(), "user_uid": user_uid}))
+            
+        created = []
+        
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            
+            try:
+                async with session.begin_nested():
+                    uids = await self._insert_books([row for _, row in chunk], session)
+                    
+                created.extend({"index": index, "uid": uid} for (index, _), uid in zip(chunk, uids))
+                
+            except DBAPIError:
+                # find the rows of the chunk the database refuses
+                for index, row in chunk:
+                    try:
+                        async with session.begin_nested():
+                            uids = await self._insert_books([row], session)
+                            
+                        created.append({"index": index, "uid": uids[0]})
+                        
+                    except DBAPIError as e:
+                        errors.append({
+                            "index": index,
+                            "errors": [{"type": "database_error", "msg": str(e.orig)}]
+                        })
+                        
+        await session.commit()
+        
+        if created:
+            await response_cache.invalidate("books")
+            
+        errors.sort(key=lambda error: error["index"])
+        
+        return {"created": created, "errors": errors}
+    
+    async def _insert_books(self, rows: List[dict], session: AsyncSession) -> List[uuid.UUID]:
+        # one INSERT ... VALUES (...), (...) RETURNING uid, the uids come back in the order of rows
+        statement = insert(Book).returning(Book.uid, sort_by_parameter_order=True)
+        result = await session.exec(statement, params=rows)
+        
+        return list(result.scalars())
+    
+    async def get_user_books(
+        self,
+        user_uid: uuid.UUID,
+        session: AsyncSession,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        fieldset: BookFieldSet = BookFieldSet()
+    ):
         # get the book with user_uid equal to the user_uid provided match (get books of user)
+        statement = sqlmodel.select(Book).where(Book.user_uid == user_uid).options(
+            *book_fieldset_options(fieldset)
+        )
+        
+        return await self._get_books_page(statement, limit, cursor, session)
+    
+    async def _get_books_page(self, statement, limit: int, cursor: Optional[str], session: AsyncSession):
+        """
+        Apply keyset pagination on (created_at, uid) to a select of books
+        
+        Rows are located by seeking the (created_at, uid) index past the last row
+        of the previous page, so a deep page costs the same as the first one.
+        """
+        if cursor is not None:
+            values = decode_cursor(cursor)
+            
+            try:
+                last_created_at = datetime.fromisoformat(values["created_at"])
+                last_uid = uuid.UUID(values["uid"])
+            except (KeyError, TypeError, ValueError):
+                raise InvalidCursorException()
+                
+            statement = statement.where(
+                tuple_(Book.created_at, Book.uid) < tuple_(last_created_at, last_uid)
+            )
+            
+        # fetch one extra row to know if there is a next page
+        statement = statement.order_by(
+            sqlmodel.desc(Book.created_at), sqlmodel.desc(Book.uid)
+        ).limit(limit + 1)
+        
+        result = await session.exec(statement)
+        books = result.all()
+        
+        next_cursor = None
+        if len(books) > limit:
+            books = books[:limit]
+            last_book = books[-1]
+            next_cursor = encode_cursor({
+                "created_at": last_book.created_at.isoformat(),
+                "uid": str(last_book.uid)
+            })
+            
+        return {"items": books, "next_cursor": next_cursor}
+    
+    async def search_books(
+        self,
+        query: str,
+        session: AsyncSession,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        language: Optional[str] = None,
+        tag: Optional[str] = None
+    ):
+        """
+        Full text search over the title, author and publisher of the books
+        
+        The matches are found through the GIN index on search_vector and ranked
+        with ts_rank_cd, title matches weigh more than author and publisher ones.
+        Pages are walked by keyset on (rank, uid).
+        
+        Args:
+            query (str): web search syntax, e.g. "dune -messiah" or "\"lord of the rings\""
+            language (str): only books in this language
+            tag (str): only books with the tag of this name
+            
+        Returns:
+            dict: the (book, rank) rows of the page and the cursor of the next page
+        """
+        ts_query = func.websearch_to_tsquery(BOOK_SEARCH_CONFIG, query)
+        rank = func.ts_rank_cd(book_search_vector, ts_query).label("rank")
+        
+        statement = sqlmodel.select(Book, rank).where(book_search_vector.op("@@")(ts_query))
+        
+        if language is not None:
+            statement = statement.where(Book.language == language)
+            
+        if tag is not None:
+            statement = statement.where(
+                sqlmodel.exists()
+                .where(BookTag.book_id == Book.uid)
+                .where(BookTag.tag_id == Tag.uid)
+                .where(Tag.name == tag)
+            )
+            
+        if cursor is not None:
+            values = decode_cursor(cursor)
+            
+            try:
+                last_rank = float(values["rank"])
+                last_uid = uuid.UUID(values["uid"])
+            except (KeyError, TypeError, ValueError):
+                raise InvalidCursorException()
+                
+            statement = statement.where(
+                tuple_(rank.element, Book.uid) < tuple_(last_rank, last_uid)
+            )
+            
+        statement = statement.order_by(sqlmodel.desc(rank), sqlmodel.desc(Book.uid)).limit(limit + 1)
+        
+        result = await session.exec(statement)
+        rows = result.all()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_book, last_rank = rows[-1]
+            next_cursor = encode_cursor({"rank": last_rank, "uid": str(last_book.uid)})
+            
+        return {"items": rows, "next_cursor": next_cursor}
+    
+    async def get_top_rated_books(
+        self,
+        session: AsyncSession,
+        limit: int = DEFAULT_PAGE_SIZE,
+        min_reviews: int = 1
+    ) -> List[Book]:
+        """
+        Get the books with the best average rating
+        
+        The books are read in order from the (avg_rating, review_count, uid)
+        index, ties on the average go to the book with more reviews.
+        
+        Args:
+            limit (int): maximum number of books
+            min_reviews (int): leave out the books with fewer reviews
+            
+        Returns:
+            list: the books, best rated first
+        """
         statement = (
             sqlmodel.select(Book)
-            .where(Book.user_uid == user_uid)
-            .order_by(sqlmodel.desc(Book.created_at))
+            .where(Book.avg_rating.is_not(None))
+            .where(Book.review_count >= min_reviews)
+            .order_by(sqlmodel.desc(Book.avg_rating), sqlmodel.desc(Book.review_count), sqlmodel.desc(Book.uid))
+            .limit(limit)
         )
-        
         result = await session.exec(statement)
         
         return result.all()
     
-    async def get_book(self, book_uid: uuid.UUID, session: AsyncSession):
+    async def adjust_rating(
+        self,
+        book_uid: uuid.UUID,
+        review_count: int,
+        rating_sum: int,
+        session: AsyncSession
+    ) -> Optional[uuid.UUID]:
+        """
+        Add to the rating aggregates of a book, in the transaction of the review write
+        
+        The increment happens in the UPDATE so concurrent reviews of the same
+        book do not overwrite each other. The version of the book is bumped as
+        the reviews are part of its payloads.
+        
+        Args:
+            review_count (int): 1 for an added review, -1 for a deleted one
+            rating_sum (int): the rating of the review, negated for a deleted one
+            
+        Returns:
+            UUID: the uid of the book, None when there is no such book
+        """
+        statement = (
+            update(Book)
+            .where(Book.uid == book_uid)
+            .values(
+                review_count=Book.review_count + review_count,
+                rating_sum=Book.rating_sum + rating_sum,
+                updated_at=datetime.now()
+            )
+            .returning(Book.uid)
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.exec(statement)
+        
+        return result.scalar()
+    
+    async def reconcile_ratings(
+        self,
+        session: AsyncSession,
+        batch_size: int = RECONCILE_BATCH_SIZE
+    ) -> List[uuid.UUID]:
+        """
+        Recompute the rating aggregates of every book from its reviews
+        
+        The books are walked in uid order, batch_size at a time with a
+        transaction per batch. The books of a batch are locked before their
+        reviews are counted so a review written meanwhile waits instead of
+        being lost. Only the books whose aggregates drifted are written.
+        
+        Returns:
+            list: the uids of the books that were corrected
+        """
+        corrected = []
+        last_uid = None
+        
+        while True:
+            statement = sqlmodel.select(Book.uid).order_by(Book.uid).limit(batch_size).with_for_update()
+            
+            if last_uid is not None:
+                statement = statement.where(Book.uid > last_uid)
+                
+            result = await session.exec(statement)
+            book_uids = result.all()
+            
+            if not book_uids:
+                break
+                
+            totals = (
+                sqlmodel.select(
+                    Book.uid.label("book_uid"),
+                    func.count(Review.uid).label("review_count"),
+                    func.coalesce(func.sum(Review.rating), 0).label("rating_sum")
+                )
+                .select_from(Book)
+                .outerjoin(Review, Review.book_uid == Book.uid)
+                .where(Book.uid.between(book_uids[0], book_uids[-1]))
+                .group_by(Book.uid)
+                .subquery()
+            )
+            statement = (
+                update(Book)
+                .where(Book.uid == totals.c.book_uid)
+                .where(
+                    tuple_(Book.review_count, Book.rating_sum)
+                    != tuple_(totals.c.review_count, totals.c.rating_sum)
+                )
+                .values(
+                    review_count=totals.c.review_count,
+                    rating_sum=totals.c.rating_sum,
+                    updated_at=datetime.now()
+                )
+                .returning(Book.uid)
+                .execution_options(synchronize_session=False)
+            )
+            result = await session.exec(statement)
+            batch_corrected = list(result.scalars())
+            await session.commit()
+            
+            if batch_corrected:
+                await response_cache.invalidate("books", *(f"book:{uid}" for uid in batch_corrected))
+                corrected.extend(batch_corrected)
+                
+            last_uid = book_uids[-1]
+            
+        return corrected
+    
+    async def get_book(self, book_uid: uuid.UUID, session: AsyncSession, with_relations: bool = False):
         """
         Get a book by its UUID
         
         Args:
             book_uuid (str) : the UUID of the book
+            with_relations (bool): also load the tags, otherwise only the book row
             
         Returns:
             Book: the book object
         """
-        statement = sqlmodel.select(Book).where(Book.uid == book_uid).options(
-            selectinload(Book.reviews),
-            selectinload(Book.tags)
-        )
+        statement = sqlmodel.select(Book).where(Book.uid == book_uid)
+        
+        if with_relations:
+            statement = statement.options(*BOOK_RELATIONS)
+            
         result = await session.exec(statement)
         
         book = result.first()
         
         return book if book is not None else None
     
+    async def get_book_version(self, book_uid: uuid.UUID, session: AsyncSession) -> Optional[datetime]:
+        """
+        Get the version stamp of a book without loading it
+        
+        Args:
+            book_uid (str): the UUID of the book
+            
+        Returns:
+            datetime: the last time the book changed, None when there is no such book
+        """
+        statement = sqlmodel.select(
+            func.coalesce(Book.updated_at, Book.created_at)
+        ).where(Book.uid == book_uid)
+        result = await session.exec(statement)
+        
+        return result.first()
+    
     async def update_book(self, book_uid: uuid.UUID, update_data: BookUpdateModel, session: AsyncSession):
         """
         Update a book
@@ -102,6 +546,8 @@ class BookService:
                 
             await session.commit()
             
+            await response_cache.invalidate("books", f"book:{book_uid}")
+            
             return book_to_update
         
         else:
@@ -114,6 +560,7 @@ class BookService:
         Args:
             book_uid (str): the UUID of the book
         """
+        # the reviews and book_tags rows of the book are updated by the delete
         book_to_delete = await self.get_book(book_uuid, session)
         
         if book_to_delete is not None:
@@ -121,6 +568,8 @@ class BookService:
             
             await session.commit()
             
+            await response_cache.invalidate("books", f"book:{book_uuid}")
+            
             return {}
         
         else:
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from src.config import Config
+from src.db.redis import backend
+from src.metrics import CACHE_ENTRIES, CACHE_LOOKUPS, RESPONSE_CACHE_LOOKUPS
+
+class TTLCache:
+    """
+    Bounded in-process LRU cache whose entries also expire after a ttl.
+
+    It is not shared between workers and not thread safe, it is meant to be
+    used from the event loop only. A named cache reports its lookups and size
+    on /metrics.
+    """
+    def __init__(self, maxsize: int, ttl: float, name: Optional[str] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (monotonic expiry time, value), least recently used first
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._hits = CACHE_LOOKUPS.labels(name, "hit") if name else None
+        self._misses = CACHE_LOOKUPS.labels(name, "miss") if name else None
+        self._size = CACHE_ENTRIES.labels(name) if name else None
+
+    def _record(self, counter) -> None:
+        if counter is not None:
+            counter.inc()
+
+    def _record_size(self) -> None:
+        if self._size is not None:
+            self._size.set(len(self._entries))
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self._record(self._misses)
+            return default
+
+        expires_at, value = entry
+
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self._record(self._misses)
+            self._record_size()
+            return default
+
+        self._entries.move_to_end(key)
+        self._record(self._hits)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store a value, ttl overrides the default ttl of the cache for this entry
+        """
+        ttl = self.ttl if ttl is None else ttl
+
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+        self._record_size()
+
+    def delete(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+        self._record_size()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._record_size()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class ResponseCache:
+    """
+    Serialized response bodies in the shared backend, keyed by namespace and parameters.
+
+    Every namespace ("books" for all the listings, "book:<uid>" for one book,
+    "tags") has a random generation token that is part of the keys of its
+    entries. A write replaces the token so every entry of the namespace becomes
+    unreachable at once and simply expires. Concurrent misses on the same key in
+    a worker wait for a single recompute.
+    """
+    key_prefix = "response:"
+
+    def __init__(self, ttl: int, enabled: bool) -> None:
+        self.ttl = ttl
+        self.enabled = enabled
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    async def _generation(self, namespace: str) -> str:
+        generation_key = f"{self.key_prefix}generation:{namespace}"
+        generation = await backend.get(generation_key)
+
+        if generation is None:
+            generation = uuid.uuid4().hex.encode()
+            # outlives the entries so they stay reachable until they expire
+            await backend.set(generation_key, generation, ex=self.ttl * 2)
+
+        return generation.decode()
+
+    async def get_or_compute(
+        self,
+        namespace: str,
+        params: dict,
+        compute: Callable[[], Awaitable[bytes | None]]
+    ) -> bytes | None:
+        """
+        Return the cached body or the body built by compute, None bodies are not cached.
+        """
+        if not self.enabled:
+            return await compute()
+
+        params_digest = hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()
+
+        try:
+            generation = await self._generation(namespace)
+            key = f"{self.key_prefix}{namespace}:{generation}:{params_digest}"
+            cached = await backend.get(key)
+        except Exception as e:
+            # serve from the database while the cache backend is down
+            logging.exception(e)
+            return await compute()
+
+        if cached is not None:
+            RESPONSE_CACHE_LOOKUPS.labels(namespace.split(":")[0], "hit").inc()
+            return cached
+
+        future = self._inflight.get(key)
+
+        if future is not None:
+            RESPONSE_CACHE_LOOKUPS.labels(namespace.split(":")[0], "coalesced").inc()
+
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # the request computing the body went away, compute it here
+                return await compute()
+
+        RESPONSE_CACHE_LOOKUPS.labels(namespace.split(":")[0], "miss").inc()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+
+        try:
+            body = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # the waiters, if any, get the error, nobody else has to retrieve it
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+        future.set_result(body)
+
+        if body is not None:
+            try:
+                await backend.set(key, body, ex=self.ttl)
+            except Exception as e:
+                logging.exception(e)
+
+        return body
+
+    async def invalidate(self, *namespaces: str) -> None:
+        if not self.enabled:
+            return
+
+        try:
+            await backend.set_many(
+                {f"{self.key_prefix}generation:{namespace}": uuid.uuid4().hex for namespace in namespaces},
+                ex=self.ttl * 2
+            )
+        except Exception as e:
+            # the write is already committed, the stale bodies still expire after ttl
+            logging.exception(e)
+
+response_cache = ResponseCache(ttl=Config.RESPONSE_CACHE_TTL, enabled=Config.RESPONSE_CACHE_ENABLED)
@@ -0,0 +1,60 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response, status
+
+def make_etag(*parts) -> str:
+    """Weak validator built from the version stamp of a resource"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+
+    return f'W/"{digest[:20]}"'
+
+def _to_utc(value: datetime) -> datetime:
+    # timestamps are stored naive in the local time of the server
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+def validator_headers(etag: str, last_modified: datetime | None) -> dict:
+    headers = {
+        "ETag": etag,
+        # the responses need a token, clients may keep them but have to revalidate
+        "Cache-Control": "private, no-cache"
+    }
+
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_to_utc(last_modified), usegmt=True)
+
+    return headers
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime | None) -> bool:
+    """
+    Evaluate If-None-Match, or If-Modified-Since when there is no If-None-Match (RFC 9110).
+    """
+    if_none_match = request.headers.get("if-none-match")
+
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+
+        # weak comparison, W/ prefixes are ignored
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+        return etag.removeprefix("W/") in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+
+    if if_modified_since is None or last_modified is None:
+        return False
+
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
+    return _to_utc(last_modified) <= since
+
+def not_modified(headers: dict) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
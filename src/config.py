@@ -2,12 +2,60 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # asyncpg prepared statement caches, set both to 0 behind pgbouncer in transaction mode
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 100
+    # statements a request may run before it is reported, routes can override it with query_budget
+    DB_QUERY_BUDGET: int = 20
+    # the same statement run this many times in one request is reported as a possible N+1
+    DB_N_PLUS_ONE_THRESHOLD: int = 5
+    # fail the request instead of logging a warning, meant for tests
+    DB_QUERY_BUDGET_STRICT: bool = False
+    # adds the query count and time of the request to the response headers
+    DEBUG: bool = False
     JWT_SECRET: str
     JWT_ALGORITHM: str
     REFRESH_TOKEN_EXPIRY: int
+    # verified token cache of decode_token, entries also expire with the token
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_TTL: int = 3600
+    # bcrypt calls that may run at the same time, each one uses a cpu core for ~100ms
+    PASSWORD_HASH_WORKERS: int = 2
     
+    # "redis" shares the blocklist and caches between workers, "memory" keeps them in the worker
+    CACHE_BACKEND: str = "redis"
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
+    REDIS_DB: int = 0
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: int = 5
+    REDIS_SOCKET_TIMEOUT: float = 2.0
+    REDIS_CONNECT_TIMEOUT: float = 2.0
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
+    # full reload of the local revocation filter, pub/sub keeps it current in between
+    REVOCATION_RESYNC_INTERVAL: int = 60
+    # serialized catalog reads in the cache backend, invalidated by the writes
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL: int = 300
+    
+    # identity (uid, email, role) cache of UserService.get_user_identity
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: int = 60
+    USER_CACHE_REDIS: bool = False
+    USER_CACHE_REDIS_TTL: int = 600
+    
+    # access log of the middleware, written to stdout when no file is set
+    ACCESS_LOG_FILE: str | None = None
+    # share of successful requests that are logged, errors are always logged
+    ACCESS_LOG_SAMPLE_RATE: float = 1.0
+    ACCESS_LOG_QUEUE_SIZE: int = 10000
+    ACCESS_LOG_BATCH_SIZE: int = 256
     
     MAIL_USERNAME: str
     MAIL_PASSWORD: str
@@ -15,12 +63,32 @@ class Settings(BaseSettings):
     MAIL_PORT: int
     MAIL_SERVER: str
     MAIL_FROM_NAME: str
-    MAIL_STARTTLS: bool = False
+    # src.mail and the delivery workers of src.mail_dispatch both connect with these,
+    # STARTTLS on 587 by default, MAIL_SSL_TLS instead for a server on 465
+    MAIL_STARTTLS: bool = True
     MAIL_SSL_TLS: bool = False
     USE_CREDENTIALS: bool = True
     VALIDATE_CERTS: bool = True
     DOMAIN: str
-    
+    # background delivery of src.mail_dispatch, the queue is in redis unless CACHE_BACKEND is "memory"
+    MAIL_WORKERS: int = 2
+    # recipients per message, servers commonly refuse more than 100 per transaction
+    MAIL_BATCH_SIZE: int = 50
+    MAIL_MAX_ATTEMPTS: int = 5
+    # first retry delay, doubled on every attempt up to MAIL_RETRY_MAX_DELAY
+    MAIL_RETRY_DELAY: float = 10.0
+    MAIL_RETRY_MAX_DELAY: float = 900.0
+    MAIL_TIMEOUT: float = 30.0
+    # an open SMTP connection unused this long is closed
+    MAIL_IDLE_TIMEOUT: float = 60.0
+    # a job taken by a worker that died is queued again after this long
+    MAIL_VISIBILITY_TIMEOUT: int = 300
+    # templates of src.mail_templates, a locale without its own template gets the default one
+    MAIL_DEFAULT_LOCALE: str = "en"
+    MAIL_TEMPLATE_CACHE_SIZE: int = 1000
+    MAIL_TEMPLATE_CACHE_TTL: int = 3600
+    MAIL_RENDER_WORKERS: int = 2
+
     model_config = SettingsConfigDict(
         env_file = ".env",
         extra="ignore"
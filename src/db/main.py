@@ -1,16 +1,81 @@
-from sqlmodel import create_engine, SQLModel
-from sqlalchemy.ext.asyncio import AsyncEngine
+from collections import Counter
+from contextvars import ContextVar
+import time
+
+from fastapi import Request
+
+from sqlmodel import SQLModel
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from src.config import Config
 
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import sessionmaker
 
-print(Config.DATABASE_URL)
+def get_connect_args() -> dict:
+    """driver level options, the statement caches only exist for asyncpg"""
+    if make_url(Config.DATABASE_URL).get_driver_name() != "asyncpg":
+        return {}
+    
+    return {
+        # cache of prepared statements kept by asyncpg for each connection
+        "statement_cache_size": Config.DB_STATEMENT_CACHE_SIZE,
+        # cache of prepared statements kept by the sqlalchemy asyncpg adapter
+        "prepared_statement_cache_size": Config.DB_PREPARED_STATEMENT_CACHE_SIZE
+    }
 
-db_connect = AsyncEngine(create_engine(
+db_connect = create_async_engine(
     url=Config.DATABASE_URL,
-    echo=True
-))
+    echo=Config.DB_ECHO,
+    pool_size=Config.DB_POOL_SIZE,
+    max_overflow=Config.DB_MAX_OVERFLOW,
+    pool_timeout=Config.DB_POOL_TIMEOUT,
+    pool_recycle=Config.DB_POOL_RECYCLE,
+    pool_pre_ping=Config.DB_POOL_PRE_PING,
+    connect_args=get_connect_args()
+)
+
+class QueryStats:
+    """Number of statements and time spent in the database by the current request"""
+    __slots__ = ("count", "seconds", "statements")
+    
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+        # executions of every distinct statement, the same one over and over is an N+1
+        self.statements = Counter()
+        
+# set by the middleware for every request, None outside of a request
+query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+@event.listens_for(db_connect.sync_engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_started_at = time.perf_counter()
+    
+@event.listens_for(db_connect.sync_engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = query_stats.get()
+    
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += time.perf_counter() - context.query_started_at
+        stats.statements[statement] += 1
+        
+def query_budget(max_queries: int | None):
+    """
+    Dependency to override DB_QUERY_BUDGET for the routes that use it, None
+    turns the check off for routes whose statements grow with the input (batches)
+    """
+    async def set_query_budget(request: Request):
+        request.state.query_budget = max_queries
+        
+    return set_query_budget
+
+# session factory is built once and shared by every request
+async_session_maker = sessionmaker(
+    bind=db_connect, class_=AsyncSession, expire_on_commit=False
+)
 
 async def initdb():
     """creates a connection to our database"""
@@ -22,9 +87,23 @@ async def get_session():
     """
     Dependency to provide the session object
     """
-    async_session = sessionmaker(
-        bind=db_connect, class_=AsyncSession, expire_on_commit=False
-    )
+    async with async_session_maker() as session:
+        yield session
+        
+def get_pool_stats() -> dict:
+    """
+    Saturation of the connection pool of this worker for monitoring
+    
+    Returns:
+        dict: connections in the pool, checked out and opened over the pool size
+    """
+    pool = db_connect.pool
     
-    async with async_session() as session:
-        yield session
\ No newline at end of file
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": Config.DB_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "available": pool.size() + Config.DB_MAX_OVERFLOW - pool.checkedout()
+    }
@@ -3,7 +3,11 @@ from datetime import date, datetime
 from typing import List, Optional
 
 import sqlalchemy.dialects.postgresql as pg
-from sqlmodel import Column, Field, Relationship, SQLModel
+from sqlalchemy import Computed
+from sqlmodel import Column, Field, Index, Relationship, SQLModel, UniqueConstraint
+
+# relationships are never loaded implicitly (lazy="raise"), every query states
+# with loader options the relationships its response needs.
 
 class User(SQLModel, table=True):
     __tablename__ = "user_accounts"
@@ -17,7 +21,8 @@ class User(SQLModel, table=True):
         sa_column=Column(pg.VARCHAR, nullable=False, server_default="user")
     )
     is_verified: bool = False
-    email: str
+    # every login and token check looks the user up by email
+    email: str = Field(index=True)
     password_hash: str = Field(exclude=True, min_length=5)
     created_at: datetime = Field(
         sa_column=Column(
@@ -27,21 +32,36 @@ class User(SQLModel, table=True):
         )
     )
     books: List["Book"] = Relationship(
-        back_populates="user", sa_relationship_kwargs={"lazy": "selectin"}
+        back_populates="user", sa_relationship_kwargs={"lazy": "raise"}
     )
     reviews: List["Review"] = Relationship(
-        back_populates="user", sa_relationship_kwargs={"lazy": "selectin"}
+        back_populates="user", sa_relationship_kwargs={"lazy": "raise"}
     )
     
     def __repr__(self) -> str:
         return f"<User {self.username}>"
 class BookTag(SQLModel, table=True):
     __tablename__ = "book_tags"
+    # the primary key starts with book_id, this one finds the books of a tag
+    __table_args__ = (
+        Index("ix_book_tags_tag_id", "tag_id"),
+    )
     book_id: uuid.UUID = Field(default=None, foreign_key="books.uid", primary_key=True)
     tag_id: uuid.UUID = Field(default=None, foreign_key="tags.uid", primary_key=True)
     
 class Book(SQLModel, table=True):
     __tablename__ = "books"
+    # keyset pagination walks the listing in (created_at, uid) order
+    __table_args__ = (
+        Index("ix_books_created_at_uid", "created_at", "uid"),
+        # the books of a user, in the keyset order of their listing
+        Index("ix_books_user_uid_created_at_uid", "user_uid", "created_at", "uid"),
+        # the top rated listing, read backwards for avg_rating DESC, review_count DESC, uid DESC
+        Index("ix_books_avg_rating_review_count_uid", "avg_rating", "review_count", "uid"),
+    )
+    # fetch avg_rating, computed by postgres, with RETURNING on every insert and update,
+    # otherwise the flush expires it and the async session cannot load it lazily
+    __mapper_args__ = {"eager_defaults": True}
     
     uid: uuid.UUID = Field(
         default_factory=uuid.uuid4,
@@ -59,17 +79,54 @@ class Book(SQLModel, table=True):
     page_count: int
     language: str
     user_uid: Optional[uuid.UUID] = Field(default=None, foreign_key="user_accounts.uid")
-    created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
-    updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
-    user: Optional["User"] = Relationship(back_populates="books")
-    reviews: List["Review"] = Relationship(back_populates="book", sa_relationship_kwargs={"lazy": "selectin"})
-    tags: List["Tag"] = Relationship(link_model=BookTag, back_populates="books", sa_relationship_kwargs={"lazy": "selectin"})
+    # NOT NULL, the listings page on (created_at, uid)
+    created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, nullable=False, default=datetime.now))
+    # version stamp behind the ETag and Last-Modified of the book
+    updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now, onupdate=datetime.now))
+    # rating aggregates of the reviews, adjusted in the transaction of every review
+    # write and recomputed by src.books.reconcile when they drift
+    review_count: int = Field(default=0, sa_column=Column(pg.INTEGER, nullable=False, default=0, server_default="0"))
+    rating_sum: int = Field(default=0, sa_column=Column(pg.INTEGER, nullable=False, default=0, server_default="0"))
+    # maintained by postgres, None while the book has no review
+    avg_rating: Optional[float] = Field(
+        default=None,
+        sa_column=Column(
+            pg.DOUBLE_PRECISION,
+            Computed("rating_sum::double precision / NULLIF(review_count, 0)", persisted=True)
+        )
+    )
+    user: Optional["User"] = Relationship(back_populates="books", sa_relationship_kwargs={"lazy": "raise"})
+    reviews: List["Review"] = Relationship(back_populates="book", sa_relationship_kwargs={"lazy": "raise"})
+    tags: List["Tag"] = Relationship(link_model=BookTag, back_populates="books", sa_relationship_kwargs={"lazy": "raise"})
     
     def __repr__(self) -> str:
         return f"<Book {self.title}>"
     
+# full text search document of a book, maintained by postgres. It is only used in
+# the WHERE and ORDER BY of the search so it is a column of the table but not a
+# field of the model, select(Book) and the responses never carry it.
+BOOK_SEARCH_CONFIG = "english"
+book_search_vector = Column(
+    "search_vector",
+    pg.TSVECTOR,
+    Computed(
+        f"setweight(to_tsvector('{BOOK_SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+        f"setweight(to_tsvector('{BOOK_SEARCH_CONFIG}', coalesce(author, '')), 'B') || "
+        f"setweight(to_tsvector('{BOOK_SEARCH_CONFIG}', coalesce(publisher, '')), 'C')",
+        persisted=True
+    )
+)
+Book.__table__.append_column(book_search_vector)
+Index("ix_books_search_vector", book_search_vector, postgresql_using="gin")
+
 class Review(SQLModel, table=True):
     __tablename__ = "reviews"
+    # the reviews of a book are paged by recency or by rating, the
+    # (book_uid, created_at, uid) index also serves the lookups by book_uid
+    __table_args__ = (
+        Index("ix_reviews_book_uid_created_at_uid", "book_uid", "created_at", "uid"),
+        Index("ix_reviews_book_uid_rating_created_at_uid", "book_uid", "rating", "created_at", "uid"),
+    )
     uid: uuid.UUID = Field(
         sa_column=Column(
             pg.UUID,
@@ -80,20 +137,25 @@ class Review(SQLModel, table=True):
     )
     rating: int = Field(lt=5)
     review_txt: str = Field(sa_column=Column(pg.VARCHAR, nullable=False))
-    user_uid: Optional[uuid.UUID] = Field(default=None, foreign_key="user_accounts.uid")
+    user_uid: Optional[uuid.UUID] = Field(default=None, foreign_key="user_accounts.uid", index=True)
     book_uid: Optional[uuid.UUID] = Field(default=None, foreign_key="books.uid")
+    # NOT NULL, the review pages are walked in (created_at, uid) order
     created_at: datetime = Field(sa_column=Column(
-        pg.TIMESTAMP, default=datetime.now
+        pg.TIMESTAMP, nullable=False, default=datetime.now
     ))
     updated_at: datetime = Field(sa_column=Column(
         pg.TIMESTAMP, default=datetime.now
     ))
-    user: Optional[User] = Relationship(back_populates="reviews")
-    book: Optional[Book] = Relationship(back_populates="reviews")  
+    user: Optional[User] = Relationship(back_populates="reviews", sa_relationship_kwargs={"lazy": "raise"})
+    book: Optional[Book] = Relationship(back_populates="reviews", sa_relationship_kwargs={"lazy": "raise"})  
 # association table between books and tags for many to many relationship
 # we use two primary key combination to enforce association and not create multiple association between same book and tag.
 class Tag(SQLModel, table=True):
     __tablename__ = "tags"
+    # tags are looked up and upserted by name
+    __table_args__ = (
+        UniqueConstraint("name", name="uq_tags_name"),
+    )
     uid: uuid.UUID = Field(
         sa_column=Column(
             pg.UUID,
@@ -104,11 +166,12 @@ class Tag(SQLModel, table=True):
     )
     name: str = Field(sa_column=Column(pg.VARCHAR, nullable=False))
     created_at : datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
+    updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now, onupdate=datetime.now))
     books: List["Book"] = Relationship(
         # association between Book model and Tag table is managed by the BookTag model.
         link_model=BookTag,
         back_populates="tags",
-        sa_relationship_kwargs={"lazy": "selectin"}
+        sa_relationship_kwargs={"lazy": "raise"}
     )
     
     def __repr__(self) -> str:
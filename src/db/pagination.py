@@ -0,0 +1,40 @@
+import base64
+import json
+from typing import Any, Dict
+
+from src.errors import InvalidCursorException
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    """
+    Encode the sort key of the last row of a page into an opaque cursor token.
+
+    Args:
+        values (dict): the keyset values (e.g. created_at and uid) of the last row
+
+    Returns:
+        str: url safe token the client sends back to get the next page
+    """
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode()
+
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str) -> Dict[str, Any]:
+    """
+    Decode a cursor token created by encode_cursor.
+
+    Raises:
+        InvalidCursorException: the token was not created by us or is corrupted
+    """
+    try:
+        padding = "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(token + padding))
+    except (ValueError, TypeError):
+        raise InvalidCursorException()
+
+    if not isinstance(values, dict):
+        raise InvalidCursorException()
+
+    return values
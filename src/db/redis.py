@@ -1,17 +1,321 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 import redis.asyncio as aioredis
 from src.config import Config
 
 # should be same as access token expiry otherwise the token might be able to access after the redis blocklist expires.
 JTI_EXPIRY = 3600
+# every worker learns about revocations made by the others on this channel
+REVOCATION_CHANNEL = "token_blocklist:revoked"
+# revoked jtis scored by the unix time their token expires, the filters resync from it
+REVOKED_JTIS_KEY = "token_blocklist:jtis"
+
+class CommandStats:
+    """Number of redis round trips and time spent waiting on redis by the current request"""
+    __slots__ = ("count", "seconds")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+
+# set by the middleware for every request, None outside of a request
+command_stats: ContextVar[CommandStats | None] = ContextVar("command_stats", default=None)
+
+@contextmanager
+def record_command():
+    started_at = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        stats = command_stats.get()
+
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += time.perf_counter() - started_at
+
+class CacheBackend:
+    """
+    Key value store behind the token blocklist and the shared caches.
+    """
+    async def get(self, key: str) -> bytes | None:
+        raise NotImplementedError("Please override this method in inherit class.")
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        raise NotImplementedError("Please override this method in inherit class.")
+
+    async def set(self, key: str, value: str | bytes, ex: int) -> None:
+        raise NotImplementedError("Please override this method in inherit class.")
+
+    async def set_many(self, mapping: dict[str, str | bytes], ex: int) -> None:
+        raise NotImplementedError("Please override this method in inherit class.")
+
+    async def delete(self, *keys: str) -> None:
+        raise NotImplementedError("Please override this method in inherit class.")
+
+    async def close(self) -> None:
+        pass
+
+class MemoryBackend(CacheBackend):
+    """
+    Backend local to the worker for single node deployments, tests and benchmarks.
+    """
+    # expired entries are swept after this many writes
+    sweep_every = 1000
+
+    def __init__(self) -> None:
+        # key -> (value, monotonic expiry time)
+        self._entries: dict[str, tuple[bytes, float]] = {}
+        self._writes = 0
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+
+        if entry is None:
+            return None
+
+        value, expires_at = entry
+
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        return value
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, value: str | bytes, ex: int) -> None:
+        if isinstance(value, str):
+            value = value.encode()
+
+        self._entries[key] = (value, time.monotonic() + ex)
+        self._writes += 1
+
+        if self._writes % self.sweep_every == 0:
+            now = time.monotonic()
+            self._entries = {k: v for k, v in self._entries.items() if v[1] > now}
+
+    async def set_many(self, mapping: dict[str, str | bytes], ex: int) -> None:
+        for key, value in mapping.items():
+            await self.set(key, value, ex)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+class RedisBackend(CacheBackend):
+    """
+    Backend shared by all the workers, commands on many keys are sent in one round trip.
+    """
+    def __init__(self) -> None:
+        # waits for a free connection up to REDIS_POOL_TIMEOUT instead of failing when all are busy
+        self.pool = aioredis.BlockingConnectionPool(
+            host=Config.REDIS_HOST,
+            port=Config.REDIS_PORT,
+            db=Config.REDIS_DB,
+            max_connections=Config.REDIS_MAX_CONNECTIONS,
+            timeout=Config.REDIS_POOL_TIMEOUT,
+            socket_timeout=Config.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=Config.REDIS_CONNECT_TIMEOUT,
+            health_check_interval=Config.REDIS_HEALTH_CHECK_INTERVAL
+        )
+        self.client = aioredis.Redis(connection_pool=self.pool)
+
+    async def get(self, key: str) -> bytes | None:
+        with record_command():
+            return await self.client.get(key)
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        if not keys:
+            return []
+
+        with record_command():
+            return await self.client.mget(keys)
+
+    async def set(self, key: str, value: str | bytes, ex: int) -> None:
+        with record_command():
+            await self.client.set(name=key, value=value, ex=ex)
+
+    async def set_many(self, mapping: dict[str, str | bytes], ex: int) -> None:
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                pipe.set(name=key, value=value, ex=ex)
+
+            with record_command():
+                await pipe.execute()
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            with record_command():
+                await self.client.delete(*keys)
+
+    async def revoke(self, jtis: list[str], expires_at: float) -> None:
+        """Record the jtis in the revoked set and announce them on the revocation channel."""
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.zadd(REVOKED_JTIS_KEY, {jti: expires_at for jti in jtis})
+            pipe.expireat(REVOKED_JTIS_KEY, int(expires_at) + 1)
+
+            for jti in jtis:
+                pipe.publish(REVOCATION_CHANNEL, jti)
+
+            with record_command():
+                await pipe.execute()
+
+    async def revoked(self) -> dict[str, float]:
+        """Revoked jtis whose token has not expired yet, with the time it expires."""
+        now = time.time()
+
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(REVOKED_JTIS_KEY, "-inf", now)
+            pipe.zrangebyscore(REVOKED_JTIS_KEY, now, "+inf", withscores=True)
 
-token_blocklist = aioredis.StrictRedis(
-    host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=0
+            with record_command():
+                _, entries = await pipe.execute()
+
+        return {jti.decode(): expires_at for jti, expires_at in entries}
+
+    def pubsub(self):
+        return self.client.pubsub()
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+def create_backend() -> CacheBackend:
+    if Config.CACHE_BACKEND == "memory":
+        return MemoryBackend()
+
+    return RedisBackend()
+
+class RevocationFilter:
+    """
+    In-process copy of the revoked jtis kept current through redis pub/sub.
+
+    While the subscription is live a jti missing from the local set is known
+    not to be revoked, so the check needs no network hop. Before the first load
+    and whenever the subscription drops the filter is not synced and callers
+    have to ask redis. The revoked set is reloaded periodically as a safety net,
+    it only holds the jtis of tokens not expired yet so the reload stays small.
+    """
+    def __init__(self, backend: RedisBackend, resync_interval: int) -> None:
+        self.backend = backend
+        self.resync_interval = resync_interval
+        self.synced = False
+        # jti -> unix time after which the token has expired anyway
+        self._revoked: dict[str, float] = {}
+        self._task: asyncio.Task | None = None
+
+    def add(self, jti: str, expires_at: float | None = None) -> None:
+        self._revoked[jti] = expires_at or time.time() + JTI_EXPIRY
+
+    def __contains__(self, jti: str) -> bool:
+        expires_at = self._revoked.get(jti)
+
+        return expires_at is not None and expires_at > time.time()
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        self.synced = False
+
+        if self._task is not None:
+            self._task.cancel()
+
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+            self._task = None
+
+    async def _load(self) -> None:
+        revoked = await self.backend.revoked()
+
+        # keep revocations received while loading
+        now = time.time()
+        revoked.update({jti: exp for jti, exp in self._revoked.items() if exp > now})
+        self._revoked = revoked
+
+    async def _listen(self) -> None:
+        retry_delay = 1
+
+        while True:
+            try:
+                async with self.backend.pubsub() as pubsub:
+                    await pubsub.subscribe(REVOCATION_CHANNEL)
+                    # load after subscribing so nothing revoked in between is missed
+                    await self._load()
+                    self.synced = True
+                    retry_delay = 1
+                    next_resync = time.monotonic() + self.resync_interval
+
+                    while True:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+
+                        if message is not None:
+                            self.add(message["data"].decode())
+
+                        if time.monotonic() >= next_resync:
+                            await self._load()
+                            next_resync = time.monotonic() + self.resync_interval
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception as e:
+                self.synced = False
+                logging.exception(e)
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 30)
+
+backend = create_backend()
+
+# only a shared backend needs a local filter, the memory backend is already local
+revocation_filter = (
+    RevocationFilter(backend, resync_interval=Config.REVOCATION_RESYNC_INTERVAL)
+    if isinstance(backend, RedisBackend) else None
 )
 
 async def add_jti_to_blocklist(jti: str) -> None:
-    await token_blocklist.set(name=jti, value="", ex=JTI_EXPIRY)
-    
+    await add_jtis_to_blocklist([jti])
+
+async def add_jtis_to_blocklist(jtis: list[str]) -> None:
+    await backend.set_many({jti: "" for jti in jtis}, ex=JTI_EXPIRY)
+
+    if revocation_filter is not None:
+        expires_at = time.time() + JTI_EXPIRY
+        await backend.revoke(jtis, expires_at)
+
+        for jti in jtis:
+            revocation_filter.add(jti, expires_at)
+
 async def token_in_blocklist(jti: str) -> bool:
-    jti = await token_blocklist.get(jti)
-    
-    return jti is not None
\ No newline at end of file
+    revoked = await tokens_in_blocklist([jti])
+
+    return revoked[0]
+
+async def tokens_in_blocklist(jtis: list[str]) -> list[bool]:
+    if revocation_filter is not None and revocation_filter.synced:
+        return [jti in revocation_filter for jti in jtis]
+
+    values = await backend.get_many(jtis)
+
+    return [value is not None for value in values]
+
+async def get_cached_value(key: str) -> bytes | None:
+    return await backend.get(key)
+
+async def set_cached_value(key: str, value: str | bytes, ex: int) -> None:
+    await backend.set(key, value, ex=ex)
+
+async def delete_cached_value(key: str) -> None:
+    await backend.delete(key)
@@ -51,6 +51,14 @@ class UserNotFoundException(AppException):
     """User not found."""
     pass
 
+class InvalidCursorException(AppException):
+    """User has provided a pagination cursor that is malformed."""
+    pass
+
+class InvalidFieldsException(AppException):
+    """User has asked for a field or relation the resource does not have."""
+    pass
+
 def create_exception_handler(
     status_code: int,
     initial_detail: Any
@@ -192,6 +200,30 @@ def register_error_handlers(app: FastAPI):
         ),
     )
     
+    app.add_exception_handler(
+        InvalidCursorException,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            initial_detail={
+                "message": "Pagination cursor is invalid",
+                "resolution": "Please start again from the first page",
+                "error_code": "invalid_cursor",
+            },
+        ),
+    )
+    
+    app.add_exception_handler(
+        InvalidFieldsException,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            initial_detail={
+                "message": "Unknown field or include requested",
+                "resolution": "Please check the fields and include parameters",
+                "error_code": "invalid_fields",
+            },
+        ),
+    )
+    
     @app.exception_handler(500)
     async def internal_server_error(request, exception):
         return JSONResponse(
@@ -12,19 +12,19 @@ mail_config = ConnectionConfig(
     # The email address of the sender
     MAIL_FROM=Config.MAIL_FROM,
     # The port used to connect to the SMTP server (usually 587 for TLS).
-    MAIL_PORT=587,
+    MAIL_PORT=Config.MAIL_PORT,
     # The SMTP server used to send emails
     MAIL_SERVER=Config.MAIL_SERVER,
     # The name displayed as the sender of the email
     MAIL_FROM_NAME=Config.MAIL_FROM_NAME,
     # Enables the STARTTLS command, upgrades connection to TLS/SSL
-    MAIL_STARTTLS=True,
+    MAIL_STARTTLS=Config.MAIL_STARTTLS,
     # Indicates whether to use SSL/TLS for the connection from the start.
-    MAIL_SSL_TLS=False,
+    MAIL_SSL_TLS=Config.MAIL_SSL_TLS,
     # Specifies whether to use credentials to authenticate with the SMTP Server
-    USE_CREDENTIALS=True,
+    USE_CREDENTIALS=Config.USE_CREDENTIALS,
     # Specifies whether to validate the server's SSL certificates
-    VALIDATE_CERTS=True,
+    VALIDATE_CERTS=Config.VALIDATE_CERTS,
     # Specifies the folder containing email templates, useful to sending HTML emails with Jinja Templates.
     TEMPLATE_FOLDER=Path(BASE_DIR, "templates")
 )
@@ -0,0 +1,356 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from email.message import EmailMessage
+from email.utils import formataddr, make_msgid
+
+import aiosmtplib
+import orjson
+
+from src.config import Config
+from src.db.redis import RedisBackend, backend
+from src.metrics import MAIL_MESSAGES
+
+class MailQueue:
+    """
+    Mail jobs waiting for delivery.
+
+    pop hands a job to one worker, the worker then either acks it (delivered or
+    given up) or retries it after a delay.
+    """
+    async def push(self, job: dict) -> None:
+        raise NotImplementedError("Please override this method in inherit class.")
+
+    async def pop(self, timeout: float) -> tuple[bytes, dict] | None:
+        raise NotImplementedError("Please override this method in inherit class.")
+
+    async def ack(self, raw: bytes) -> None:
+        raise NotImplementedError("Please override this method in inherit class.")
+
+    async def retry(self, raw: bytes, job: dict, delay: float) -> None:
+        raise NotImplementedError("Please override this method in inherit class.")
+
+    async def dead(self, raw: bytes, job: dict) -> None:
+        raise NotImplementedError("Please override this method in inherit class.")
+
+    async def requeue_due(self) -> None:
+        """Queue the jobs whose retry delay is over, a no-op when delays are timers."""
+        pass
+
+class MemoryMailQueue(MailQueue):
+    """
+    Queue local to the worker for single node deployments and tests, jobs are lost on restart.
+    """
+    def __init__(self, dead_size: int = 1000) -> None:
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.dead_jobs: deque = deque(maxlen=dead_size)
+
+    async def push(self, job: dict) -> None:
+        self._queue.put_nowait(job)
+
+    async def pop(self, timeout: float) -> tuple[bytes, dict] | None:
+        try:
+            job = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+        return b"", job
+
+    async def ack(self, raw: bytes) -> None:
+        pass
+
+    async def retry(self, raw: bytes, job: dict, delay: float) -> None:
+        asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job)
+
+    async def dead(self, raw: bytes, job: dict) -> None:
+        self.dead_jobs.append(job)
+
+class RedisMailQueue(MailQueue):
+    """
+    Queue in redis shared by all the workers, jobs survive restarts.
+
+    A popped job is moved atomically from the queue list to a processing list
+    and leased for visibility_timeout seconds. Jobs still in processing when
+    their lease expires, because the worker died, are queued again. Retries wait
+    in a sorted set scored by the time they are due.
+    """
+    queue_key = "mail:queue"
+    processing_key = "mail:processing"
+    leases_key = "mail:leases"
+    delayed_key = "mail:delayed"
+    dead_key = "mail:dead"
+    # failed jobs kept for inspection
+    dead_size = 1000
+
+    def __init__(self, backend: RedisBackend, visibility_timeout: int) -> None:
+        self.backend = backend
+        self.visibility_timeout = visibility_timeout
+
+    @property
+    def client(self):
+        return self.backend.client
+
+    async def push(self, job: dict) -> None:
+        await self.client.rpush(self.queue_key, orjson.dumps(job))
+
+    async def pop(self, timeout: float) -> tuple[bytes, dict] | None:
+        raw = await self.client.blmove(self.queue_key, self.processing_key, timeout, "LEFT", "RIGHT")
+
+        if raw is None:
+            return None
+
+        await self.client.zadd(self.leases_key, {raw: time.time() + self.visibility_timeout})
+
+        return raw, orjson.loads(raw)
+
+    async def _finish(self, raw: bytes, pipe) -> None:
+        pipe.lrem(self.processing_key, 1, raw)
+        pipe.zrem(self.leases_key, raw)
+        await pipe.execute()
+
+    async def ack(self, raw: bytes) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            await self._finish(raw, pipe)
+
+    async def retry(self, raw: bytes, job: dict, delay: float) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zadd(self.delayed_key, {orjson.dumps(job): time.time() + delay})
+            await self._finish(raw, pipe)
+
+    async def dead(self, raw: bytes, job: dict) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.lpush(self.dead_key, orjson.dumps(job))
+            pipe.ltrim(self.dead_key, 0, self.dead_size - 1)
+            await self._finish(raw, pipe)
+
+    async def requeue_due(self) -> None:
+        now = time.time()
+
+        # every worker runs this, only the one removing an entry queues it
+        for raw in await self.client.zrangebyscore(self.delayed_key, 0, now, start=0, num=100):
+            if await self.client.zrem(self.delayed_key, raw):
+                await self.client.rpush(self.queue_key, raw)
+
+        for raw in await self.client.zrangebyscore(self.leases_key, 0, now, start=0, num=100):
+            if await self.client.zrem(self.leases_key, raw) and await self.client.lrem(self.processing_key, 1, raw):
+                await self.client.rpush(self.queue_key, raw)
+
+        # a worker that died between the move and the lease left a job without lease
+        for raw in await self.client.lrange(self.processing_key, 0, -1):
+            await self.client.zadd(self.leases_key, {raw: now + self.visibility_timeout}, nx=True)
+
+class MailSettingsError(Exception):
+    """The server refuses the session the mail settings ask for, e.g. no STARTTLS or AUTH offered."""
+    pass
+
+class SMTPConnection:
+    """
+    SMTP connection of one delivery worker, opened on the first message and kept
+    open for the next ones until it stays unused for MAIL_IDLE_TIMEOUT.
+    """
+    def __init__(self) -> None:
+        self._smtp: aiosmtplib.SMTP | None = None
+        self._last_used = 0.0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        if self._smtp is not None and self._smtp.is_connected:
+            return self._smtp
+
+        smtp = aiosmtplib.SMTP(
+            hostname=Config.MAIL_SERVER,
+            port=Config.MAIL_PORT,
+            use_tls=Config.MAIL_SSL_TLS,
+            start_tls=Config.MAIL_STARTTLS,
+            validate_certs=Config.VALIDATE_CERTS,
+            timeout=Config.MAIL_TIMEOUT
+        )
+        try:
+            await smtp.connect()
+
+            if Config.USE_CREDENTIALS:
+                await smtp.login(Config.MAIL_USERNAME, Config.MAIL_PASSWORD)
+        except (
+            aiosmtplib.SMTPResponseException,
+            aiosmtplib.SMTPServerDisconnected,
+            aiosmtplib.SMTPConnectError,
+            aiosmtplib.SMTPTimeoutError
+        ):
+            smtp.close()
+            raise
+        except aiosmtplib.SMTPException as e:
+            # the extension is missing on every attempt, e.g. AUTH on a connection left in cleartext
+            smtp.close()
+            raise MailSettingsError(f"{e}, check MAIL_PORT, MAIL_STARTTLS and MAIL_SSL_TLS") from e
+
+        self._smtp = smtp
+
+        return smtp
+
+    async def send(self, message: EmailMessage, recipients: list[str]) -> dict:
+        """
+        Send one message to the recipients, the refused ones are returned with their error.
+        """
+        # the server may have closed the connection since the last message, reconnect once
+        for attempt in range(2):
+            smtp = await self._connect()
+
+            try:
+                errors, _ = await smtp.send_message(message, sender=Config.MAIL_FROM, recipients=recipients)
+                self._last_used = time.monotonic()
+                return errors
+            except aiosmtplib.SMTPServerDisconnected:
+                self._smtp = None
+
+                if attempt:
+                    raise
+            except Exception:
+                # start the next message on a fresh connection, the session state is unknown
+                await self.close()
+                raise
+
+    async def close_if_idle(self) -> None:
+        if self._smtp is not None and time.monotonic() - self._last_used > Config.MAIL_IDLE_TIMEOUT:
+            await self.close()
+
+    async def close(self) -> None:
+        smtp, self._smtp = self._smtp, None
+
+        if smtp is not None and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
+
+def build_message(job: dict, recipients: list[str]) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = formataddr((Config.MAIL_FROM_NAME, Config.MAIL_FROM))
+    message["To"] = ", ".join(recipients)
+    message["Subject"] = job["subject"]
+    message["Message-ID"] = make_msgid(domain=Config.DOMAIN)
+    message.set_content(job["body"], subtype=job.get("subtype", "html"))
+
+    return message
+
+def is_permanent(error: Exception) -> bool:
+    # 5xx replies and settings the server refuses will not succeed on a retry, 4xx and connection errors may
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return error.code >= 500
+
+    return isinstance(error, MailSettingsError)
+
+def retry_delay(attempts: int) -> float:
+    return min(Config.MAIL_RETRY_DELAY * 2 ** (attempts - 1), Config.MAIL_RETRY_MAX_DELAY)
+
+class MailDispatcher:
+    """
+    Delivers the queued mail in the background of the app.
+
+    Every worker task keeps its own SMTP connection and sends the recipients of
+    a job in messages of MAIL_BATCH_SIZE recipients. A transient failure puts
+    the job back with the recipients still to reach after an exponential
+    backoff, after MAIL_MAX_ATTEMPTS or on a permanent failure it is given up.
+    """
+    def __init__(self, queue: MailQueue, workers: int) -> None:
+        self.queue = queue
+        self.workers = workers
+        self._tasks: list[asyncio.Task] = []
+
+    async def enqueue(self, recipients: list[str], subject: str, body: str, subtype: str = "html") -> str:
+        job_id = uuid.uuid4().hex
+        await self.queue.push({
+            "id": job_id,
+            "recipients": recipients,
+            "subject": subject,
+            "body": body,
+            "subtype": subtype,
+            "attempts": 0
+        })
+
+        return job_id
+
+    async def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._requeue()))
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+
+        for task in tasks:
+            task.cancel()
+
+        # a job being sent when its worker is cancelled is delivered again once its lease expires
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _requeue(self) -> None:
+        while True:
+            try:
+                await self.queue.requeue_due()
+            except Exception as e:
+                logging.exception(e)
+
+            await asyncio.sleep(1)
+
+    async def _work(self) -> None:
+        connection = SMTPConnection()
+
+        try:
+            while True:
+                try:
+                    item = await self.queue.pop(timeout=1.0)
+                except Exception as e:
+                    logging.exception(e)
+                    await asyncio.sleep(1)
+                    continue
+
+                if item is None:
+                    await connection.close_if_idle()
+                    continue
+
+                await self._deliver(connection, *item)
+        finally:
+            await connection.close()
+
+    async def _deliver(self, connection: SMTPConnection, raw: bytes, job: dict) -> None:
+        recipients = list(job["recipients"])
+        attempts = job["attempts"] + 1
+
+        try:
+            while recipients:
+                batch = recipients[:Config.MAIL_BATCH_SIZE]
+
+                try:
+                    refused = await connection.send(build_message(job, batch), batch)
+                    MAIL_MESSAGES.labels("sent").inc()
+                except aiosmtplib.SMTPRecipientsRefused as e:
+                    # the whole batch was refused, it would be refused again
+                    refused = {error.recipient: error for error in e.recipients}
+
+                if refused:
+                    logging.warning("mail %s refused for %s", job["id"], ", ".join(refused))
+
+                del recipients[:len(batch)]
+
+            await self.queue.ack(raw)
+
+        except Exception as e:
+            failed_job = {**job, "recipients": recipients, "attempts": attempts}
+
+            if is_permanent(e) or attempts >= Config.MAIL_MAX_ATTEMPTS:
+                logging.error("mail %s given up after %d attempt(s): %r", job["id"], attempts, e)
+                MAIL_MESSAGES.labels("failed").inc()
+                await self.queue.dead(raw, failed_job)
+            else:
+                logging.warning("mail %s attempt %d failed, retrying: %r", job["id"], attempts, e)
+                MAIL_MESSAGES.labels("retried").inc()
+                await self.queue.retry(raw, failed_job, retry_delay(attempts))
+
+def create_mail_queue() -> MailQueue:
+    if isinstance(backend, RedisBackend):
+        return RedisMailQueue(backend, visibility_timeout=Config.MAIL_VISIBILITY_TIMEOUT)
+
+    return MemoryMailQueue()
+
+mail_dispatcher = MailDispatcher(create_mail_queue(), workers=Config.MAIL_WORKERS)
@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Sequence
+
+import orjson
+from jinja2 import Environment, FileSystemLoader, Template, TemplateNotFound, meta, select_autoescape
+
+from src.cache import TTLCache
+from src.config import Config
+from src.mail import mail_config
+
+# contexts rendered by one task of the pool, enough to make the hop to the pool worth it
+RENDER_CHUNK_SIZE = 200
+
+class MailTemplates:
+    """
+    Jinja templates of the mail bodies, compiled once and rendered through a cache.
+
+    load() compiles every template of the folder, auto_reload is off so they are
+    not read or checked again until the next load(). The template of a locale
+    lives in a folder named after it (e.g. ne/welcome.html) and falls back to
+    the one at the top of the folder.
+
+    Rendered bodies are cached by template, locale, version and context so a
+    body sent to many recipients is rendered once. The version is a digest of
+    the sources of the template and of the templates it extends or includes.
+    """
+    def __init__(self, folder: Path, default_locale: str, cache: TTLCache, workers: int) -> None:
+        self.folder = folder
+        self.default_locale = default_locale
+        self.cache = cache
+        self.environment = Environment(
+            loader=FileSystemLoader(folder),
+            autoescape=select_autoescape(["html", "xml"]),
+            auto_reload=False,
+            # keep every compiled template, not the 400 most recent
+            cache_size=-1
+        )
+        self.environment.globals["domain"] = Config.DOMAIN
+        # name -> (compiled template, version)
+        self._templates: dict[str, tuple[Template, str]] = {}
+        # jinja renders in python under the GIL, the pool keeps the event loop
+        # free during bulk renders rather than adding cores
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mail_render")
+
+    def load(self) -> None:
+        """Compile all the templates of the folder, again when called again."""
+        self.environment.cache.clear()
+        names = self.environment.list_templates(extensions=["html", "txt"])
+        sources = {}
+        references = {}
+
+        for name in names:
+            source, _, _ = self.environment.loader.get_source(self.environment, name)
+            sources[name] = source
+            references[name] = {
+                reference for reference in meta.find_referenced_templates(self.environment.parse(source))
+                if reference is not None
+            }
+
+        def dependencies(name: str, seen: set) -> set:
+            for reference in references.get(name, ()):
+                if reference not in seen:
+                    seen.add(reference)
+                    dependencies(reference, seen)
+
+            return seen
+
+        templates = {}
+
+        for name in names:
+            digest = hashlib.sha1()
+
+            for dependency in sorted(dependencies(name, {name})):
+                digest.update(sources.get(dependency, "").encode())
+
+            templates[name] = (self.environment.get_template(name), digest.hexdigest()[:12])
+
+        self._templates = templates
+
+    def _resolve(self, name: str, locale: str) -> tuple[Template, str]:
+        if not self._templates:
+            self.load()
+
+        entry = self._templates.get(f"{locale}/{name}") or self._templates.get(name)
+
+        if entry is None:
+            raise TemplateNotFound(name)
+
+        return entry
+
+    def _cache_key(self, name: str, locale: str, version: str, context: dict) -> tuple | None:
+        try:
+            encoded = orjson.dumps(context, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            # a value orjson does not know has no stable key, render it every time
+            return None
+
+        return (name, locale, version, hashlib.sha1(encoded).hexdigest())
+
+    def render(self, name: str, context: dict, locale: Optional[str] = None) -> str:
+        """Render one body on the event loop, meant for a body sent once or to many recipients."""
+        locale = locale or self.default_locale
+        template, version = self._resolve(name, locale)
+        key = self._cache_key(name, locale, version, context)
+        body = self.cache.get(key) if key is not None else None
+
+        if body is None:
+            body = template.render(**context, locale=locale)
+
+            if key is not None:
+                self.cache.set(key, body)
+
+        return body
+
+    async def render_batch(
+        self,
+        name: str,
+        contexts: Sequence[dict],
+        locale: Optional[str] = None,
+        cache: bool = True
+    ) -> list[str]:
+        """
+        Render the template once per context in the render pool, in the order of contexts.
+
+        Args:
+            cache (bool): look up and store the bodies in the cache, turn it off for
+                bodies personalized per recipient that would only evict the others
+        """
+        locale = locale or self.default_locale
+        template, version = self._resolve(name, locale)
+        keys = [self._cache_key(name, locale, version, context) if cache else None for context in contexts]
+        bodies = [self.cache.get(key) if key is not None else None for key in keys]
+        missing = [index for index, body in enumerate(bodies) if body is None]
+
+        def render_chunk(indexes: list[int]) -> list[str]:
+            return [template.render(**contexts[index], locale=locale) for index in indexes]
+
+        loop = asyncio.get_running_loop()
+        chunks = [missing[start:start + RENDER_CHUNK_SIZE] for start in range(0, len(missing), RENDER_CHUNK_SIZE)]
+        rendered = await asyncio.gather(*(loop.run_in_executor(self.executor, render_chunk, chunk) for chunk in chunks))
+
+        # the cache is not thread safe, it is only touched here on the event loop
+        for chunk, chunk_bodies in zip(chunks, rendered):
+            for index, body in zip(chunk, chunk_bodies):
+                bodies[index] = body
+
+                if keys[index] is not None:
+                    self.cache.set(keys[index], body)
+
+        return bodies
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+mail_templates = MailTemplates(
+    folder=Path(mail_config.TEMPLATE_FOLDER),
+    default_locale=Config.MAIL_DEFAULT_LOCALE,
+    cache=TTLCache(maxsize=Config.MAIL_TEMPLATE_CACHE_SIZE, ttl=Config.MAIL_TEMPLATE_CACHE_TTL),
+    workers=Config.MAIL_RENDER_WORKERS
+)
@@ -0,0 +1,151 @@
+import os
+
+from fastapi import FastAPI, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from src.db.main import QueryStats, get_pool_stats
+from src.db.redis import CommandStats
+
+# with several workers set PROMETHEUS_MULTIPROC_DIR to an empty directory shared
+# by the workers, every worker then writes its samples there and the scrape
+# aggregates all of them whichever worker answers it.
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time to send the whole response, by route template",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "Requests handled, by route template and status",
+    ["method", "route", "status"]
+)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests being handled",
+    multiprocess_mode="livesum"
+)
+
+DB_QUERIES = Histogram(
+    "db_queries_per_request",
+    "SQL statements executed by one request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+
+DB_TIME = Histogram(
+    "db_time_per_request_seconds",
+    "Time spent executing SQL statements by one request",
+    ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+REDIS_CALLS = Histogram(
+    "redis_calls_per_request",
+    "Redis round trips made by one request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20)
+)
+
+REDIS_TIME = Histogram(
+    "redis_time_per_request_seconds",
+    "Time spent waiting on redis by one request",
+    ["route"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "response_cache_lookups_total",
+    "Response cache lookups by namespace and result (hit, miss, coalesced)",
+    ["namespace", "result"]
+)
+
+MAIL_MESSAGES = Counter(
+    "mail_messages_total",
+    "Mail messages handled by the delivery workers by result (sent, retried, failed)",
+    ["result"]
+)
+
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Lookups of the in-process caches and their redis tiers by cache and result (hit, miss)",
+    ["cache", "result"]
+)
+
+CACHE_ENTRIES = Gauge(
+    "cache_entries",
+    "Entries held by the in-process caches",
+    ["cache"],
+    multiprocess_mode="livesum"
+)
+
+PASSWORD_HASH_QUEUE_TIME = Histogram(
+    "password_hash_queue_seconds",
+    "Time a bcrypt call waited for a worker of the password hash pool",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+PASSWORD_HASH_TIME = Histogram(
+    "password_hash_seconds",
+    "Time a bcrypt call ran in the password hash pool",
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0)
+)
+
+PASSWORD_HASH_IN_FLIGHT = Gauge(
+    "password_hash_in_flight",
+    "Bcrypt calls queued or running in the password hash pool",
+    multiprocess_mode="livesum"
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections of the database pool by state",
+    ["state"],
+    multiprocess_mode="livesum"
+)
+
+def record_request(
+    method: str,
+    route: str,
+    status_code: int,
+    duration: float,
+    query_stats: QueryStats,
+    command_stats: CommandStats
+) -> None:
+    """Called by the logging middleware once the response is sent."""
+    REQUEST_LATENCY.labels(method, route).observe(duration)
+    REQUESTS.labels(method, route, str(status_code)).inc()
+    DB_QUERIES.labels(route).observe(query_stats.count)
+    DB_TIME.labels(route).observe(query_stats.seconds)
+    REDIS_CALLS.labels(route).observe(command_stats.count)
+    REDIS_TIME.labels(route).observe(command_stats.seconds)
+
+    pool_stats = get_pool_stats()
+    DB_POOL_CONNECTIONS.labels("checked_out").set(pool_stats["checked_out"])
+    DB_POOL_CONNECTIONS.labels("checked_in").set(pool_stats["checked_in"])
+    DB_POOL_CONNECTIONS.labels("overflow").set(pool_stats["overflow"])
+
+def generate_metrics() -> bytes:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+
+    return generate_latest(REGISTRY)
+
+def register_metrics(app: FastAPI):
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(content=generate_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -1,27 +1,139 @@
 from fastapi import FastAPI, status
 from fastapi.requests import Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 
+from src.access_log import access_logger
+from src.config import Config
+from src.db.main import QueryStats, query_stats
+from src.db.redis import CommandStats, command_stats
+from src.metrics import REQUESTS_IN_FLIGHT, record_request
+from src.responses import dumps
+
+import random
 import time
 import logging
+from typing import Optional
 
 # disable the default logging given by the FastAPI app
 logger = logging.getLogger("uvicorn.access")
 logger.disabled = True
 
+def check_query_budget(request: Request, stats: QueryStats, budget: Optional[int]) -> Optional[str]:
+    """
+    Report a request that ran more statements than its budget or the same
+    statement many times, which is how a lazy load in a loop (N+1) shows up.
+    
+    Returns:
+        str: the logged report, None when the request stayed within its budget
+    """
+    if budget is None:
+        return None
+        
+    problems = []
+    
+    if stats.count > budget:
+        problems.append(f"{stats.count} queries over the budget of {budget}")
+        
+    for statement, count in stats.statements.items():
+        if count >= Config.DB_N_PLUS_ONE_THRESHOLD:
+            problems.append(f"possible N+1, ran {count} times: {' '.join(statement.split())[:200]}")
+            
+    if not problems:
+        return None
+        
+    message = f"{request.method} {request.url.path}: " + "; ".join(problems)
+    logging.warning(message)
+    
+    return message
+
+def query_budget_response(request: Request, stats: QueryStats, budget: int, message: str) -> StreamingResponse:
+    """
+    The error answered in strict mode in place of the response of the route,
+    streamed like the responses call_next returns so the access log wraps it the same way
+    """
+    content = dumps({
+        "message": message,
+        "error_code": "query_budget_exceeded",
+        "route": getattr(request.scope.get("route"), "path", None),
+        "queries": stats.count,
+        "budget": budget
+    })
+    
+    return StreamingResponse(
+        iter([content]),
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        media_type="application/json"
+    )
+
 def register_middleware(app: FastAPI):
     @app.middleware("http")
     async def custom_logging(request: Request, call_next):
-        start_time = time.time()
+        start_time = time.perf_counter()
+        stats = QueryStats()
+        query_stats.set(stats)
+        redis_stats = CommandStats()
+        command_stats.set(redis_stats)
+        REQUESTS_IN_FLIGHT.inc()
         
-        response = await call_next(request)
-        processing_time = time.time() - start_time
+        try:
+            response = await call_next(request)
+            budget = getattr(request.state, "query_budget", Config.DB_QUERY_BUDGET)
+            report = check_query_budget(request, stats, budget)
+            
+            # an exception raised here would miss the exception handlers and end as a bare 500
+            if report is not None and Config.DB_QUERY_BUDGET_STRICT:
+                response = query_budget_response(request, stats, budget, report)
+        except Exception:
+            REQUESTS_IN_FLIGHT.dec()
+            raise
         
-        message = f"{request.client.host}:{request.client.port} - {request.method} - {request.url.path} - {response.status_code} completed after {processing_time}"
+        if Config.DEBUG:
+            response.headers["X-DB-Query-Count"] = str(stats.count)
+            response.headers["X-DB-Time-Ms"] = f"{stats.seconds * 1000:.3f}"
+        
+        body_iterator = response.body_iterator
+        
+        async def body_with_access_log():
+            bytes_sent = 0
+            
+            try:
+                async for chunk in body_iterator:
+                    bytes_sent += len(chunk)
+                    yield chunk
+            finally:
+                processing_time = time.perf_counter() - start_time
+                REQUESTS_IN_FLIGHT.dec()
+                
+                # set by the router on the shared scope once a route matched
+                route = getattr(request.scope.get("route"), "path", None)
+                
+                record_request(
+                    request.method, route or "unmatched", response.status_code,
+                    processing_time, stats, redis_stats
+                )
+                
+                # sampling only applies to successful requests
+                if response.status_code >= 400 or random.random() < Config.ACCESS_LOG_SAMPLE_RATE:
+                    access_logger.log({
+                        "time": time.time(),
+                        "client": f"{request.client.host}:{request.client.port}" if request.client else None,
+                        "method": request.method,
+                        "path": request.url.path,
+                        "route": route,
+                        "status": response.status_code,
+                        "bytes": bytes_sent,
+                        "duration_ms": round(processing_time * 1000, 3),
+                        "db_queries": stats.count,
+                        "db_ms": round(stats.seconds * 1000, 3),
+                        "redis_calls": redis_stats.count,
+                        "redis_ms": round(redis_stats.seconds * 1000, 3)
+                    })
+                    
+        # logged once the body is sent so streamed responses are fully accounted
+        response.body_iterator = body_with_access_log()
         
-        print(message)
         return response
     
     app.add_middleware(
@@ -35,4 +147,4 @@ def register_middleware(app: FastAPI):
     app.add_middleware(
         TrustedHostMiddleware,
         allowed_hosts = ["localhost", "127.0.0.1"]
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,21 @@
+import uuid
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+def _default(value: Any) -> Any:
+    # asyncpg returns its own uuid subclass which orjson only handles through default
+    if isinstance(value, uuid.UUID):
+        return str(value)
+
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    """Encode plain python data (dicts, lists, uuids, datetimes) to json with orjson"""
+    return orjson.dumps(content, default=_default)
+
+class FastJSONResponse(ORJSONResponse):
+    """Default response class of the app, renders with orjson"""
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
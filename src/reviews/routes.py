@@ -1,26 +1,66 @@
 import uuid
 
-from fastapi import APIRouter, Depends, status, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, Response, status, HTTPException
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.auth.dependencies import RoleChecker, get_current_user
-from src.db.main import get_session
-from src.db.models import User
+from src.auth.dependencies import RoleChecker, get_principal
+from src.auth.schemas import Principal
+from src.books.service import BookService
+from src.cache import response_cache
+from src.db.main import get_session, query_budget
+from src.db.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from src.responses import FastJSONResponse, dumps
 
-from .schemas import ReviewCreateModel
+from .schemas import ReviewCreateModel, ReviewPageSchema, ReviewSort
+from .serializers import review_page_to_dict, review_to_dict
 from .service import ReviewService
 
 from src.errors import BookNotFoundException
 
 review_service = ReviewService()
-review_router = APIRouter()
+book_service = BookService()
+review_router = APIRouter(dependencies=[Depends(query_budget(10))])
 admin_role_checker = Depends(RoleChecker(["admin"]))
 user_role_checker = Depends(RoleChecker(["user", "admin"]))
 
 @review_router.get("/", dependencies=[admin_role_checker])
 async def get_all_reviews(session: AsyncSession = Depends(get_session)):
-    books = await review_service.get_all_reviews(session)
-    return books
+    reviews = await review_service.get_all_reviews(session)
+    return FastJSONResponse([review_to_dict(review) for review in reviews])
+
+@review_router.get("/book/{book_uid}", response_model=ReviewPageSchema, dependencies=[user_role_checker])
+async def get_book_reviews(
+    book_uid: uuid.UUID,
+    sort: ReviewSort = ReviewSort.recent,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    async def reviews_page_json():
+        reviews_page = await review_service.get_book_reviews(
+            book_uid, session, limit=limit, cursor=cursor, sort=sort
+        )
+        
+        # an empty first page is either a book without reviews or no book at all
+        if not reviews_page["items"] and cursor is None:
+            if await book_service.get_book_version(book_uid, session) is None:
+                return None
+                
+        return dumps(review_page_to_dict(reviews_page["items"], reviews_page["next_cursor"]))
+    
+    # review writes invalidate the namespace of their book
+    content = await response_cache.get_or_compute(
+        f"book:{book_uid}",
+        {"reviews": True, "sort": sort.value, "limit": limit, "cursor": cursor},
+        reviews_page_json
+    )
+    
+    if content is None:
+        raise BookNotFoundException()
+    
+    return Response(content=content, media_type="application/json")
 
 @review_router.get("/{review_uid}", dependencies=[user_role_checker])
 async def get_review(review_uid: uuid.UUID, session: AsyncSession = Depends(get_session)):
@@ -33,11 +73,11 @@ async def get_review(review_uid: uuid.UUID, session: AsyncSession = Depends(get_
 async def add_review_to_books(
     book_uid: uuid.UUID,
     review_data: ReviewCreateModel,
-    current_user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
     session: AsyncSession = Depends(get_session)
 ):
     new_review = await review_service.add_review_to_book(
-        user_email=current_user.email,
+        user_email=principal.email,
         review_data=review_data,
         book_uid=book_uid,
         session=session
@@ -52,12 +92,12 @@ async def add_review_to_books(
 )
 async def delete_review(
     review_uid: uuid.UUID,
-    current_user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
     session: AsyncSession = Depends(get_session)
 ):
     await review_service.delete_review_to_from_book(
         review_uid=review_uid,
-        user_email=current_user.email,
+        user_email=principal.email,
         session=session
     )
     
@@ -1,6 +1,7 @@
 import uuid
 from datetime import datetime
-from typing import Optional
+from enum import Enum
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -15,4 +16,15 @@ class ReviewModel(BaseModel):
     
 class ReviewCreateModel(BaseModel):
     rating: int = Field(lt=5)
-    review_txt: str
\ No newline at end of file
+    review_txt: str
+    
+class ReviewPageSchema(BaseModel):
+    items: List[ReviewModel]
+    # pass it as the cursor query parameter to get the next page, None on the last page
+    next_cursor: Optional[str] = None
+    
+class ReviewSort(str, Enum):
+    # newest first
+    recent = "recent"
+    # best rating first, newest first among equal ratings
+    rating = "rating"
@@ -0,0 +1,22 @@
+from typing import Optional, Sequence
+
+from src.db.models import Review
+
+def review_to_dict(review: Review) -> dict:
+    """Same fields and order as ReviewModel, read straight from the ORM object"""
+    return {
+        "uid": review.uid,
+        "rating": review.rating,
+        "review_txt": review.review_txt,
+        "user_uid": review.user_uid,
+        "book_uid": review.book_uid,
+        "created_at": review.created_at,
+        "updated_at": review.updated_at,
+    }
+
+def review_page_to_dict(items: Sequence[Review], next_cursor: Optional[str]) -> dict:
+    """Same fields and order as ReviewPageSchema"""
+    return {
+        "items": [review_to_dict(review) for review in items],
+        "next_cursor": next_cursor,
+    }
@@ -1,15 +1,22 @@
 import logging
+import uuid
+from datetime import datetime
+from typing import Optional
 
 from fastapi import status
 from fastapi.exceptions import HTTPException
 import sqlmodel
+from sqlalchemy import tuple_
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.auth.service import UserService
 from src.books.service import BookService
+from src.cache import response_cache
 from src.db.models import Review
+from src.db.pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+from src.errors import InvalidCursorException
 
-from .schemas import ReviewCreateModel
+from .schemas import ReviewCreateModel, ReviewSort
 
 book_service = BookService()
 user_service = UserService()
@@ -24,7 +31,7 @@ class ReviewService:
     ):
         try:
             book = await book_service.get_book(book_uid=book_uid, session=session)
-            user = await user_service.get_user_by_email(email= user_email, session=session)
+            user = await user_service.get_user_identity(email=user_email, session=session)
             review_data_dict = review_data.model_dump()
             new_review = Review(**review_data_dict)
             
@@ -40,10 +47,13 @@ class ReviewService:
                     status_code=status.HTTP_404_NOT_FOUND
                 )
                 
-            new_review.user = user
-            new_review.book = book
+            new_review.user_uid = user.uid
+            new_review.book_uid = book.uid
             session.add(new_review)
+            await book_service.adjust_rating(book.uid, 1, new_review.rating, session)
             await session.commit()
+            # reviews are part of the book payloads
+            await response_cache.invalidate("books", f"book:{book_uid}")
             return new_review
         
         except Exception as e:
@@ -58,6 +68,70 @@ class ReviewService:
         result = await session.exec(statement)
         return result.first()
     
+    async def get_book_reviews(
+        self,
+        book_uid: uuid.UUID,
+        session: AsyncSession,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        sort: ReviewSort = ReviewSort.recent
+    ):
+        """
+        Get a page of the reviews of a book
+        
+        Pages are walked by keyset on (created_at, uid) or (rating, created_at, uid)
+        with the matching index on book_uid, so a deep page costs the same as the first.
+        
+        Args:
+            limit (int): maximum number of reviews in the page
+            cursor (str): next_cursor of the previous page, None for the first page
+            sort (ReviewSort): newest first or best rated first
+            
+        Returns:
+            dict: the reviews of the page and the cursor of the next page
+        """
+        if sort == ReviewSort.rating:
+            keyset = (Review.rating, Review.created_at, Review.uid)
+        else:
+            keyset = (Review.created_at, Review.uid)
+            
+        statement = sqlmodel.select(Review).where(Review.book_uid == book_uid)
+        
+        if cursor is not None:
+            values = decode_cursor(cursor)
+            
+            try:
+                if values["sort"] != sort.value:
+                    raise ValueError("cursor of another sort order")
+                    
+                last_values = [datetime.fromisoformat(values["created_at"]), uuid.UUID(values["uid"])]
+                
+                if sort == ReviewSort.rating:
+                    last_values.insert(0, int(values["rating"]))
+            except (KeyError, TypeError, ValueError):
+                raise InvalidCursorException()
+                
+            statement = statement.where(tuple_(*keyset) < tuple_(*last_values))
+            
+        # fetch one extra row to know if there is a next page
+        statement = statement.order_by(*(sqlmodel.desc(column) for column in keyset)).limit(limit + 1)
+        
+        result = await session.exec(statement)
+        reviews = result.all()
+        
+        next_cursor = None
+        if len(reviews) > limit:
+            reviews = reviews[:limit]
+            last_review = reviews[-1]
+            next_cursor = encode_cursor({
+                "sort": sort.value,
+                "rating": last_review.rating,
+                "created_at": last_review.created_at.isoformat(),
+                "uid": str(last_review.uid)
+            })
+            
+        return {"items": reviews, "next_cursor": next_cursor}
+    
     async def get_all_reviews(self, session: AsyncSession):
         statement = sqlmodel.select(Review).order_by(sqlmodel.desc(Review.created_at))
         result = await session.exec(statement)
@@ -69,14 +143,16 @@ class ReviewService:
         user_email: str,
         session: AsyncSession
     ):
-        user = await user_service.get_user_by_email(user_email, session)
+        user = await user_service.get_user_identity(user_email, session)
         review = await self.get_review(review_uid=review_uid, session=session)
 
-        if not review or (review.user != user):
+        if not review or user is None or (review.user_uid != user.uid):
             raise HTTPException(
                 detail="Cannot delete this review.",
                 status_code=status.HTTP_403_FORBIDDEN
             )
             
-        session.add(review)
-        await session.commit()
\ No newline at end of file
+        await session.delete(review)
+        await book_service.adjust_rating(review.book_uid, -1, -review.rating, session)
+        await session.commit()
+        await response_cache.invalidate("books", f"book:{review.book_uid}")
\ No newline at end of file
@@ -1,24 +1,40 @@
 from typing import List
 import uuid
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Request, status
+from fastapi.responses import Response
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.auth.dependencies import RoleChecker
 from src.books.schemas import BookSchema
-from src.db.main import get_session
+from src.cache import response_cache
+from src.conditional import is_not_modified, make_etag, not_modified, validator_headers
+from src.db.main import get_session, query_budget
+from src.responses import FastJSONResponse, dumps
 
-from .schemas import TagAddModel, TagCreateModel, TagModel
+from .schemas import BooksTagAddModel, TagAddModel, TagCreateModel, TagModel
+from .serializers import tag_to_dict
 from .service import TagService
 
-tag_router = APIRouter()
+tag_router = APIRouter(dependencies=[Depends(query_budget(10))])
 tag_service = TagService()
 user_role_checker = Depends(RoleChecker(["user", "admin"]))
 
 @tag_router.get("/", response_model=List[TagModel], dependencies=[user_role_checker])
-async def get_all_tags(session: AsyncSession = Depends(get_session)):
-    tags = await tag_service.get_tags(session)
-    return tags
+async def get_all_tags(request: Request, session: AsyncSession = Depends(get_session)):
+    count, last_modified = await tag_service.get_tags_version(session)
+    etag = make_etag("tags", count, last_modified.isoformat() if last_modified else None)
+    headers = validator_headers(etag, last_modified)
+    
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(headers)
+    
+    async def tags_json():
+        tags = await tag_service.get_tags(session)
+        return dumps([tag_to_dict(tag) for tag in tags])
+    
+    content = await response_cache.get_or_compute("tags", {}, tags_json)
+    return Response(content=content, media_type="application/json", headers=headers)
 
 @tag_router.post("/", response_model=TagModel,status_code=status.HTTP_201_CREATED, dependencies=[user_role_checker])
 async def add_tag(
@@ -43,6 +59,17 @@ async def add_tags_to_book(
     )
     return book_with_tag
 
+@tag_router.post(
+    "/books",
+    response_model=List[TagModel],
+    dependencies=[user_role_checker]
+)
+async def add_tags_to_books(
+    tag_data: BooksTagAddModel, session: AsyncSession = Depends(get_session)
+) -> List[TagModel]:
+    tags = await tag_service.add_tags_to_books(tag_data=tag_data, session=session)
+    return FastJSONResponse([tag_to_dict(tag) for tag in tags])
+
 @tag_router.put("/{tag_uid}", response_model=TagModel, dependencies=[user_role_checker])
 async def update_tag(
     tag_uid: uuid.UUID,
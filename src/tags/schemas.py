@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime
 from typing import List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class TagModel(BaseModel):
     uid: uuid.UUID
@@ -13,4 +13,8 @@ class TagCreateModel(BaseModel):
     name: str
     
 class TagAddModel(BaseModel):
-    tags: List[TagCreateModel]
\ No newline at end of file
+    tags: List[TagCreateModel]
+    
+class BooksTagAddModel(BaseModel):
+    book_uids: List[uuid.UUID] = Field(min_length=1, max_length=1000)
+    tags: List[TagCreateModel] = Field(min_length=1, max_length=100)
\ No newline at end of file
@@ -0,0 +1,9 @@
+from src.db.models import Tag
+
+def tag_to_dict(tag: Tag) -> dict:
+    """Same fields and order as TagModel, read straight from the ORM object"""
+    return {
+        "uid": tag.uid,
+        "name": tag.name,
+        "created_at": tag.created_at,
+    }
@@ -1,13 +1,20 @@
+import uuid
+from datetime import datetime
+from typing import List
+
 from fastapi import status
 from fastapi.exceptions import HTTPException
 import sqlmodel
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.errors import BookNotFoundException, TagNotFoundException, TagAlreadyExistsException
 from src.books.service import BookService
-from src.db.models import Tag
+from src.cache import response_cache
+from src.db.models import Book, BookTag, Tag
 
-from .schemas import TagAddModel, TagCreateModel
+from .schemas import BooksTagAddModel, TagAddModel, TagCreateModel
 
 book_service = BookService()
 
@@ -23,6 +30,15 @@ class TagService:
         result = await session.exec(statement)
         return result.all()
     
+    async def get_tags_version(self, session: AsyncSession):
+        """Get the number of tags and the last time one changed, together they version the tag list"""
+        statement = sqlmodel.select(
+            sqlmodel.func.count(Tag.uid),
+            sqlmodel.func.max(sqlmodel.func.coalesce(Tag.updated_at, Tag.created_at))
+        )
+        result = await session.exec(statement)
+        return result.one()
+    
     async def add_tags_to_book(
         self,
         book_uid: str,
@@ -30,28 +46,83 @@ class TagService:
         session: AsyncSession
     ):
         """Add tags to a book"""
-        book = await book_service.get_book(book_uid=book_uid, session=session)
+        await self._attach_tags([book_uid], [tag.name for tag in tag_data.tags], session)
+        await session.commit()
+        await response_cache.invalidate("tags", "books", f"book:{book_uid}")
+        
+        return await book_service.get_book(book_uid=book_uid, session=session, with_relations=True)
+    
+    async def add_tags_to_books(self, tag_data: BooksTagAddModel, session: AsyncSession):
+        """Add the same tags to many books, returns the tags"""
+        book_uids = list(dict.fromkeys(tag_data.book_uids))
+        tags = await self._attach_tags(book_uids, [tag.name for tag in tag_data.tags], session)
+        await session.commit()
+        await response_cache.invalidate(
+            "tags", "books", *(f"book:{book_uid}" for book_uid in book_uids)
+        )
+        
+        return tags
+    
+    async def _attach_tags(self, book_uids: List[uuid.UUID], names: List[str], session: AsyncSession):
+        """
+        Link the tags named names to the books with a fixed number of statements
         
-        if not book:
+        The books are checked and their version bumped by one UPDATE, the tags
+        are looked up by one SELECT, the missing ones created by one INSERT and
+        all the links written by one INSERT into book_tags. Links that already
+        exist are skipped.
+        """
+        # the tags are part of the books, bump their version
+        result = await session.exec(
+            sqlmodel.update(Book)
+            .where(Book.uid.in_(book_uids))
+            .values(updated_at=datetime.now())
+            .returning(Book.uid)
+        )
+        
+        if len(result.all()) != len(book_uids):
             raise BookNotFoundException()
             
-        for tag_item in tag_data.tags:
-            result = await session.exec(
-                sqlmodel.select(Tag).where(Tag.name == tag_item.name)
+        tags = await self._get_or_create_tags(list(dict.fromkeys(names)), session)
+        
+        if tags:
+            await session.exec(
+                pg_insert(BookTag).on_conflict_do_nothing(),
+                params=[{"book_id": book_uid, "tag_id": tag.uid} for book_uid in book_uids for tag in tags]
             )
             
-            tag = result.one_or_none()
-            if not tag:
-                # create a new tag if not one
-                tag = Tag(name=tag_item.name)
-                session.add(tag)
+        return tags
+    
+    async def _get_or_create_tags(self, names: List[str], session: AsyncSession) -> List[Tag]:
+        """Get the tags with the names, in the same order, the missing ones are created"""
+        if not names:
+            return []
+            
+        result = await session.exec(sqlmodel.select(Tag).where(Tag.name.in_(names)))
+        tags = {tag.name: tag for tag in result.all()}
+        missing = [name for name in names if name not in tags]
+        
+        if missing:
+            now = datetime.now()
+            result = await session.exec(
+                pg_insert(Tag)
+                .values([
+                    {"uid": uuid.uuid4(), "name": name, "created_at": now, "updated_at": now}
+                    for name in missing
+                ])
+                .on_conflict_do_nothing(index_elements=["name"])
+                .returning(Tag)
+            )
+            tags.update({tag.name: tag for tag in result.scalars()})
             
-            book.tags.append(tag)
+            # created by a concurrent request between the lookup and the insert
+            raced = [name for name in missing if name not in tags]
             
-        session.add(book)
-        await session.commit()
-        await session.refresh(book)
-        return book
+            if raced:
+                result = await session.exec(sqlmodel.select(Tag).where(Tag.name.in_(raced)))
+                tags.update({tag.name: tag for tag in result.all()})
+                
+        return [tags[name] for name in names]
     
     async def get_tag_by_uid(self, tag_uid: str, session: AsyncSession):
         """Get tag by uid"""
@@ -59,6 +130,13 @@ class TagService:
         result = await session.exec(statement)
         return result.first()
     
+    async def _tagged_book_namespaces(self, tag_uid, session: AsyncSession):
+        """Response cache namespaces of the books carrying the tag"""
+        result = await session.exec(
+            sqlmodel.select(BookTag.book_id).where(BookTag.tag_id == tag_uid)
+        )
+        return [f"book:{book_id}" for book_id in result.all()]
+    
     async def add_tag(self, tag_data: TagCreateModel, session: AsyncSession):
         """Create a tag"""
         statement = sqlmodel.select(Tag).where(Tag.name == tag_data.name)
@@ -71,6 +149,7 @@ class TagService:
         new_tag = Tag(name=tag_data.name)
         session.add(new_tag)
         await session.commit()
+        await response_cache.invalidate("tags")
         return new_tag
     
     async def update_tag(
@@ -85,9 +164,18 @@ class TagService:
         
         for k, v in update_data_dict.items():
             setattr(tag, k, v)
-            await session.commit()
+            
+            try:
+                await session.commit()
+            except IntegrityError:
+                # renamed to the name of another tag
+                await session.rollback()
+                raise TagAlreadyExistsException()
+                
             await session.refresh(tag)
             
+        book_namespaces = await self._tagged_book_namespaces(tag.uid, session)
+        await response_cache.invalidate("tags", "books", *book_namespaces)
         return tag
     
     async def delete_tag(self, tag_uid: str, session: AsyncSession):
@@ -98,6 +186,11 @@ class TagService:
         if not tag:
             raise TagNotFoundException()
 
+        # the book_tags rows are gone after the delete
+        book_namespaces = await self._tagged_book_namespaces(tag.uid, session)
+
         await session.delete(tag)
 
-        await session.commit()
\ No newline at end of file
+        await session.commit()
+
+        await response_cache.invalidate("tags", "books", *book_namespaces)
\ No newline at end of file
@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+# settings without a default, the tests that need a real service skip when it is not reachable
+for name, value in {
+    "DATABASE_URL": "postgresql+asyncpg://postgres@localhost/bookly",
+    "JWT_SECRET": "test-secret",
+    "JWT_ALGORITHM": "HS256",
+    "REFRESH_TOKEN_EXPIRY": "2",
+    "MAIL_USERNAME": "test",
+    "MAIL_PASSWORD": "test",
+    "MAIL_FROM": "noreply@example.com",
+    "MAIL_PORT": "587",
+    "MAIL_SERVER": "localhost",
+    "MAIL_FROM_NAME": "Bookly",
+    "DOMAIN": "localhost:8000",
+}.items():
+    os.environ.setdefault(name, value)
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
@@ -0,0 +1,113 @@
+import asyncio
+import socket
+import time
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from src.config import Config
+from src.mail_dispatch import MailDispatcher, MemoryMailQueue
+
+pytestmark = pytest.mark.anyio
+
+class RecordingHandler:
+    """Accepts every message and records it with the session it came on"""
+    def __init__(self, failures: int = 0) -> None:
+        self.messages: list[tuple[int, list[str]]] = []
+        # the first messages are refused with a transient reply
+        self.failures = failures
+
+    async def handle_DATA(self, server, session, envelope) -> str:
+        if self.failures:
+            self.failures -= 1
+            return "451 try again later"
+
+        self.messages.append((id(session), list(envelope.rcpt_tos)))
+        return "250 OK"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    def start(handler: RecordingHandler) -> Controller:
+        controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+        controller.start()
+        servers.append(controller)
+        monkeypatch.setattr(Config, "MAIL_SERVER", controller.hostname)
+        monkeypatch.setattr(Config, "MAIL_PORT", controller.port)
+
+        return controller
+
+    servers = []
+    monkeypatch.setattr(Config, "MAIL_STARTTLS", False)
+    monkeypatch.setattr(Config, "MAIL_SSL_TLS", False)
+    monkeypatch.setattr(Config, "USE_CREDENTIALS", False)
+    monkeypatch.setattr(Config, "MAIL_BATCH_SIZE", 2)
+    monkeypatch.setattr(Config, "MAIL_RETRY_DELAY", 0.05)
+
+    yield start
+
+    for controller in servers:
+        controller.stop()
+
+async def wait_for(condition, timeout: float = 5.0) -> None:
+    started_at = time.monotonic()
+
+    while not condition():
+        assert time.monotonic() - started_at < timeout, "timed out"
+        await asyncio.sleep(0.01)
+
+async def test_recipients_are_sent_in_batches_over_one_connection(smtp_server):
+    handler = RecordingHandler()
+    smtp_server(handler)
+    dispatcher = MailDispatcher(MemoryMailQueue(), workers=1)
+    recipients = [f"reader{i}@example.com" for i in range(5)]
+
+    await dispatcher.enqueue(recipients, "New books", "<p>hello</p>")
+    await dispatcher.start()
+
+    try:
+        await wait_for(lambda: len(handler.messages) == 3)
+    finally:
+        await dispatcher.stop()
+
+    assert [rcpt_tos for _, rcpt_tos in handler.messages] == [recipients[:2], recipients[2:4], recipients[4:]]
+    assert len({session for session, _ in handler.messages}) == 1
+
+async def test_transient_failure_is_retried(smtp_server):
+    handler = RecordingHandler(failures=1)
+    smtp_server(handler)
+    queue = MemoryMailQueue()
+    dispatcher = MailDispatcher(queue, workers=1)
+
+    await dispatcher.enqueue(["reader@example.com"], "New books", "<p>hello</p>")
+    await dispatcher.start()
+
+    try:
+        await wait_for(lambda: len(handler.messages) == 1)
+    finally:
+        await dispatcher.stop()
+
+    assert not queue.dead_jobs
+
+async def test_server_without_auth_gives_up_at_once(smtp_server, monkeypatch):
+    # the server only offers AUTH over TLS, like a 587 server reached without STARTTLS
+    handler = RecordingHandler()
+    smtp_server(handler)
+    monkeypatch.setattr(Config, "USE_CREDENTIALS", True)
+    queue = MemoryMailQueue()
+    dispatcher = MailDispatcher(queue, workers=1)
+
+    await dispatcher.enqueue(["reader@example.com"], "New books", "<p>hello</p>")
+    await dispatcher.start()
+
+    try:
+        await wait_for(lambda: len(queue.dead_jobs) == 1)
+    finally:
+        await dispatcher.stop()
+
+    assert queue.dead_jobs[0]["attempts"] == 1
+    assert not handler.messages
@@ -0,0 +1,332 @@
+"""
+Plans of the service queries, no lookup or listing may scan a large table sequentially.
+
+The lookups and listings of the services are run against the database of
+TEST_DATABASE_URL, migrated to head, every statement they send is captured and
+run again with EXPLAIN. A Seq Scan node on a table holding more than MIN_ROWS
+rows fails the query. The queries reading a whole table on purpose (tag list,
+review list, export) are not checked.
+
+Users, books, reviews and tags marked "plancheck" are added first so the
+planner has tables big enough to prefer the indexes, and removed afterwards.
+That is 300k+ rows, so the checks are skipped unless TEST_DATABASE_URL names a
+database set aside for them.
+"""
+import json
+import os
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.auth.cache import user_identity_cache
+from src.auth.service import UserService
+from src.books.fieldsets import BookFieldSet
+from src.books.service import BookService
+from src.config import Config
+from src.reviews.schemas import ReviewSort
+from src.reviews.service import ReviewService
+from src.tags.service import TagService
+
+user_service = UserService()
+book_service = BookService()
+review_service = ReviewService()
+tag_service = TagService()
+
+# tables at least this big must not be seq scanned
+MIN_ROWS = 10000
+SEED_SIZES = {"users": 20000, "books": 100000, "reviews": 200000, "tags": 2000}
+
+SEED_SQL = [
+    """
+    INSERT INTO user_accounts (uid, username, first_name, last_name, role, is_verified, email, password_hash, created_at)
+    SELECT gen_random_uuid(), 'plancheck' || i, 'Plan', 'Check', 'user', true,
+        'plancheck-' || i || '@example.com', 'plancheck', now()
+    FROM generate_series(1, :users) AS i
+    """,
+    """
+    INSERT INTO books (uid, title, author, publisher, published_date, page_count, language, user_uid, created_at, updated_at)
+    SELECT gen_random_uuid(), 'Plan check ' || i, 'Author ' || i % 997, 'Plan Check Press', '2020',
+        100 + i % 500, 'English', users.uid, now() - make_interval(secs => i), now()
+    FROM generate_series(1, :books) AS i
+    JOIN (
+        SELECT uid, row_number() OVER (ORDER BY uid) - 1 AS position
+        FROM user_accounts WHERE email LIKE 'plancheck-%'
+    ) AS users ON users.position = i % :users
+    """,
+    """
+    INSERT INTO reviews (uid, rating, review_txt, user_uid, book_uid, created_at, updated_at)
+    SELECT gen_random_uuid(), i % 5, 'plancheck', users.uid, books.uid, now() - make_interval(secs => i), now()
+    FROM generate_series(1, :reviews) AS i
+    JOIN (
+        SELECT uid, row_number() OVER (ORDER BY uid) - 1 AS position
+        FROM user_accounts WHERE email LIKE 'plancheck-%'
+    ) AS users ON users.position = i % :users
+    JOIN (
+        SELECT uid, row_number() OVER (ORDER BY uid) - 1 AS position
+        FROM books WHERE publisher = 'Plan Check Press'
+    ) AS books ON books.position = (i * 7) % :books
+    """,
+    """
+    INSERT INTO tags (uid, name, created_at, updated_at)
+    SELECT gen_random_uuid(), 'plancheck-' || i, now(), now()
+    FROM generate_series(1, :tags) AS i
+    """,
+    """
+    INSERT INTO book_tags (book_id, tag_id)
+    SELECT books.uid, tags.uid
+    FROM (
+        SELECT uid, row_number() OVER (ORDER BY uid) - 1 AS position
+        FROM books WHERE publisher = 'Plan Check Press'
+    ) AS books
+    JOIN (
+        SELECT uid, row_number() OVER (ORDER BY uid) - 1 AS position
+        FROM tags WHERE name LIKE 'plancheck-%'
+    ) AS tags ON tags.position IN (books.position % :tags, (books.position * 3 + 1) % :tags)
+    ON CONFLICT DO NOTHING
+    """,
+]
+
+CLEANUP_SQL = [
+    "DELETE FROM book_tags USING books WHERE books.uid = book_tags.book_id AND books.publisher = 'Plan Check Press'",
+    "DELETE FROM book_tags USING tags WHERE tags.uid = book_tags.tag_id AND tags.name LIKE 'plancheck-%'",
+    "DELETE FROM reviews WHERE review_txt = 'plancheck'",
+    "DELETE FROM books WHERE publisher = 'Plan Check Press'",
+    "DELETE FROM tags WHERE name LIKE 'plancheck-%'",
+    "DELETE FROM user_accounts WHERE email LIKE 'plancheck-%'",
+]
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+async def get_user_identity_uncached(session, values):
+    # a cached identity sends no statement, the lookup of a cache miss is the one checked
+    await user_identity_cache.invalidate(values["email"])
+    return await user_service.get_user_identity(values["email"], session)
+
+# label -> call of a service, with the keys of sample_values
+CALLS = {
+    "UserService.get_user_identity": get_user_identity_uncached,
+    "UserService.get_user_by_email": lambda session, values: user_service.get_user_by_email(values["email"], session),
+    "UserService.get_user_with_books": lambda session, values: user_service.get_user_with_books(
+        values["email"], session
+    ),
+    "BookService.get_all_books": lambda session, values: book_service.get_all_books(session, limit=20),
+    "BookService.get_all_books (next page)": lambda session, values: book_service.get_all_books(
+        session, limit=20, cursor=values["next_cursor"]
+    ),
+    "BookService.get_all_books (fields)": lambda session, values: book_service.get_all_books(
+        session, limit=20, fieldset=BookFieldSet(fields=("uid", "title"), include=())
+    ),
+    "BookService.get_user_books": lambda session, values: book_service.get_user_books(
+        values["user_uid"], session, limit=20
+    ),
+    "BookService.get_top_rated_books": lambda session, values: book_service.get_top_rated_books(session, limit=20),
+    "BookService.get_book": lambda session, values: book_service.get_book(
+        values["book_uid"], session, with_relations=True
+    ),
+    "BookService.get_book_version": lambda session, values: book_service.get_book_version(values["book_uid"], session),
+    "BookService.search_books": lambda session, values: book_service.search_books(
+        values["search_term"], session, limit=20
+    ),
+    "BookService.search_books (tag)": lambda session, values: book_service.search_books(
+        values["search_term"], session, limit=20, tag=values["tag_name"]
+    ),
+    "ReviewService.get_book_reviews": lambda session, values: review_service.get_book_reviews(
+        values["book_uid"], session, limit=20
+    ),
+    "ReviewService.get_book_reviews (rating)": lambda session, values: review_service.get_book_reviews(
+        values["book_uid"], session, limit=20, sort=ReviewSort.rating
+    ),
+    "ReviewService.get_review": lambda session, values: review_service.get_review(values["review_uid"], session),
+    "TagService.get_tag_by_uid": lambda session, values: tag_service.get_tag_by_uid(values["tag_uid"], session),
+    "TagService._tagged_book_namespaces": lambda session, values: tag_service._tagged_book_namespaces(
+        values["tag_uid"], session
+    ),
+    "TagService._get_or_create_tags": lambda session, values: tag_service._get_or_create_tags(
+        [values["tag_name"]], session
+    ),
+}
+
+@pytest.fixture(scope="module")
+def anyio_backend():
+    # the seeded tables and the recorded plans are shared by all the tests of the module
+    return "asyncio"
+
+class StatementRecorder:
+    """Collects the statements the services send to the database"""
+    def __init__(self) -> None:
+        self.statements: list[tuple[str, tuple]] = []
+        self.enabled = False
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if self.enabled and not executemany:
+            self.statements.append((statement, parameters))
+
+    async def record(self, call) -> list[tuple[str, tuple]]:
+        self.statements = []
+        self.enabled = True
+
+        try:
+            await call()
+        finally:
+            self.enabled = False
+
+        return self.statements
+
+def seq_scans(plan: dict) -> list[str]:
+    """Relations scanned sequentially anywhere in a plan tree"""
+    found = []
+
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan["Relation Name"])
+
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+
+    return found
+
+async def seed(engine) -> bool:
+    """Add the plancheck rows, False when an earlier run left them in place"""
+    async with engine.begin() as conn:
+        seeded = await conn.scalar(text("SELECT count(*) FROM books WHERE publisher = 'Plan Check Press'"))
+
+        if seeded:
+            return False
+
+        for statement in SEED_SQL:
+            await conn.execute(text(statement), SEED_SIZES)
+
+        # the statistics of the new rows, so the planner knows how big the tables are
+        await conn.execute(text("ANALYZE"))
+
+    return True
+
+async def cleanup(engine) -> None:
+    async with engine.begin() as conn:
+        for statement in CLEANUP_SQL:
+            await conn.execute(text(statement))
+
+async def table_sizes(engine) -> dict[str, float]:
+    async with engine.connect() as conn:
+        result = await conn.execute(text(
+            "SELECT relname, reltuples FROM pg_class "
+            "WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace"
+        ))
+
+        return {name: rows for name, rows in result}
+
+async def sample_values(engine, session_maker) -> dict:
+    """Keys of existing rows to run the lookups with"""
+    async with engine.connect() as conn:
+        row = (await conn.execute(text(
+            "SELECT books.uid, books.title, books.user_uid, user_accounts.email "
+            "FROM books JOIN user_accounts ON user_accounts.uid = books.user_uid "
+            "ORDER BY books.created_at DESC LIMIT 1"
+        ))).one()
+        tag = (await conn.execute(text(
+            "SELECT tags.uid, tags.name FROM tags JOIN book_tags ON book_tags.tag_id = tags.uid LIMIT 1"
+        ))).one()
+        review_uid = (await conn.execute(text("SELECT uid FROM reviews LIMIT 1"))).scalar()
+
+    async with session_maker() as session:
+        first_page = await book_service.get_all_books(session, limit=20)
+
+    return {
+        "book_uid": row.uid,
+        # a term of one title, a term matching most of the table is rightly read with a seq scan
+        "search_term": row.title.split()[-1],
+        "user_uid": row.user_uid,
+        "email": row.email,
+        "tag_uid": tag.uid,
+        "tag_name": tag.name,
+        "review_uid": review_uid,
+        "next_cursor": first_page["next_cursor"],
+    }
+
+async def explain(engine, statements: list[tuple[str, tuple]], large_tables: set[str]) -> list[tuple[str, list[str]]]:
+    """The SELECT statements with the large tables their plan scans sequentially"""
+    explained = []
+
+    async with engine.connect() as conn:
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith("SELECT"):
+                continue
+
+            result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+            plan = result.scalar()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            scanned = [table for table in seq_scans(plan[0]["Plan"]) if table in large_tables]
+            explained.append((" ".join(statement.split()), scanned))
+
+    return explained
+
+@pytest.fixture(scope="module")
+async def plans():
+    if not TEST_DATABASE_URL:
+        pytest.skip("set TEST_DATABASE_URL to a database set aside for the plan checks")
+
+    if TEST_DATABASE_URL == Config.DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is the database of the app, the plan checks add 300k+ rows to it")
+
+    engine = create_async_engine(TEST_DATABASE_URL)
+    session_maker = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        await engine.dispose()
+        pytest.skip(f"database not reachable: {e!r}")
+
+    seeded = await seed(engine)
+
+    try:
+        sizes = await table_sizes(engine)
+        large_tables = {name for name, rows in sizes.items() if rows >= MIN_ROWS}
+        assert {"books", "reviews"} <= large_tables, "the tables are too small for the planner to use the indexes"
+        values = await sample_values(engine, session_maker)
+
+        recorder = StatementRecorder()
+        recorded = {}
+        event.listen(engine.sync_engine, "before_cursor_execute", recorder)
+
+        try:
+            async with session_maker() as session:
+                for label, call in CALLS.items():
+                    # every call starts from an empty identity map like a request does
+                    session.expunge_all()
+                    recorded[label] = await recorder.record(lambda: call(session, values))
+
+                await session.rollback()
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", recorder)
+
+        yield {label: await explain(engine, statements, large_tables) for label, statements in recorded.items()}
+    finally:
+        if seeded:
+            await cleanup(engine)
+
+        await engine.dispose()
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("label", list(CALLS))
+async def test_no_sequential_scan_on_large_tables(plans, label):
+    explained = plans[label]
+
+    assert explained, f"{label} sent no SELECT"
+
+    for statement, scanned in explained:
+        assert not scanned, f"{label} scans {', '.join(scanned)} sequentially: {statement[:300]}"
+
+def test_seq_scans_walks_the_plan_tree():
+    plan = {
+        "Node Type": "Nested Loop",
+        "Plans": [
+            {"Node Type": "Index Scan", "Relation Name": "books"},
+            {"Node Type": "Hash", "Plans": [{"Node Type": "Seq Scan", "Relation Name": "tags"}]},
+        ],
+    }
+
+    assert seq_scans(plan) == ["tags"]
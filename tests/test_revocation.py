@@ -0,0 +1,73 @@
+import asyncio
+import time
+import uuid
+
+import fakeredis
+import pytest
+
+from src.db.redis import JTI_EXPIRY, REVOKED_JTIS_KEY, RedisBackend, RevocationFilter
+
+pytestmark = pytest.mark.anyio
+
+# longest a revocation may take to reach the other workers
+PROPAGATION_DELAY = 2.0
+
+def shared_backend(server: fakeredis.FakeServer) -> RedisBackend:
+    backend = RedisBackend()
+    backend.client = fakeredis.FakeAsyncRedis(server=server)
+
+    return backend
+
+async def wait_for(condition, timeout: float) -> float:
+    started_at = time.monotonic()
+
+    while not condition():
+        assert time.monotonic() - started_at < timeout, "timed out"
+        await asyncio.sleep(0.01)
+
+    return time.monotonic() - started_at
+
+@pytest.fixture
+async def workers():
+    server = fakeredis.FakeServer()
+    backends = [shared_backend(server) for _ in range(2)]
+    filters = [RevocationFilter(backend, resync_interval=60) for backend in backends]
+
+    for revocation_filter in filters:
+        await revocation_filter.start()
+
+    await wait_for(lambda: all(revocation_filter.synced for revocation_filter in filters), PROPAGATION_DELAY)
+
+    yield backends, filters
+
+    for revocation_filter in filters:
+        await revocation_filter.stop()
+
+async def test_revocation_reaches_every_worker(workers):
+    backends, filters = workers
+    jti = str(uuid.uuid4())
+
+    await backends[0].revoke([jti], time.time() + JTI_EXPIRY)
+
+    for revocation_filter in filters:
+        await wait_for(lambda: jti in revocation_filter, PROPAGATION_DELAY)
+
+async def test_filter_resyncs_from_revoked_set():
+    server = fakeredis.FakeServer()
+    backend = shared_backend(server)
+    revoked, expired = str(uuid.uuid4()), str(uuid.uuid4())
+    # revoked while the worker was not subscribed, e.g. before it started
+    await backend.client.zadd(REVOKED_JTIS_KEY, {revoked: time.time() + JTI_EXPIRY, expired: time.time() - 1})
+
+    revocation_filter = RevocationFilter(shared_backend(server), resync_interval=60)
+    await revocation_filter.start()
+
+    try:
+        await wait_for(lambda: revocation_filter.synced, PROPAGATION_DELAY)
+
+        assert revoked in revocation_filter
+        assert expired not in revocation_filter
+        # expired entries are trimmed so the set only grows with the live tokens
+        assert await backend.client.zscore(REVOKED_JTIS_KEY, expired) is None
+    finally:
+        await revocation_filter.stop()